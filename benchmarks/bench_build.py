@@ -0,0 +1,306 @@
+#!/usr/bin/python
+#-*-encoding:utf-8-*-
+'''
+benchmark of build.py itself, builds synthetic cmake projects with stub cmake/make/ninja/compiler on PATH,
+so only the overhead of the driver is measured, runs offline on a plain linux box
+
+    python benchmarks/bench_build.py [--sizes 1,10,100,1000,5000] [--output bench_results.json]
+
+measured are :
+ * phase timings of cold (rebuild), warm (one source changed) && no-op (nothing changed) builds
+ * memory used by run_shell_command for large outputs, with && without capture
+ * scaling of --jobs with a fixed compile time per translation unit
+'''
+from __future__ import print_function
+import os, sys, subprocess, time, json, tempfile, shutil, stat
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUILD_SCRIPT = os.path.join(REPO_DIR, 'build.py')
+# written by stub cmake into build directory, read by stub make/ninja
+STUB_BUILD_FILE = 'stub_build.json'
+
+STUB_BUILD_TOOL = '''#!{python}
+# stub cmake/make/ninja of bench_build.py, dispatched by name it is invoked with
+import os, sys, json, subprocess
+from multiprocessing.pool import ThreadPool
+
+VERSIONS = {{'cmake': 'cmake version 3.25.0', 'make': 'GNU Make 4.3', 'ninja': '1.11.1', 'git': 'git version 2.39.0'}}
+
+def run_cmake(args):
+    source_dir = os.path.abspath(args[-1])
+    sources = []
+    for r, dirs, files in os.walk(source_dir):
+        dirs[:] = [d for d in dirs if not os.path.exists(os.path.join(r, d, 'CMakeCache.txt'))]
+        sources.extend(os.path.join(r, f) for f in sorted(files) if f.endswith('.cpp'))
+    for line in ['-- The C compiler identification is GNU 12.2.0', '-- The CXX compiler identification is GNU 12.2.0', \\
+            '-- Check for working C compiler: {{0}}/cc'.format(os.path.dirname(__file__)), \\
+            '-- Check for working CXX compiler: {{0}}/c++'.format(os.path.dirname(__file__)), \\
+            '-- Configuring done', '-- Generating done', '-- Build files have been written to: {{0}}'.format(os.getcwd())]:
+        print(line)
+    with open('CMakeCache.txt', 'w') as f:
+        f.write('CMAKE_COMMAND:INTERNAL={{0}}\\n'.format(' '.join(args)))
+    with open({stub_build_file!r}, 'w') as f:
+        json.dump({{'sources': sources, 'compiler': os.path.join(os.path.dirname(os.path.abspath(__file__)), 'c++')}}, f)
+    return 0
+
+def run_build(tool, args):
+    jobs = int(args[args.index('-j') + 1]) if '-j' in args else 1
+    with open({stub_build_file!r}, 'r') as f:
+        build = json.load(f)
+    if not os.path.exists('objs'):
+        os.makedirs('objs')
+    steps = []
+    for i, source in enumerate(build['sources']):
+        obj = os.path.join('objs', '{{0}}_{{1}}.o'.format(i, os.path.basename(source)))
+        if not os.path.exists(obj) or os.path.getmtime(obj) < os.path.getmtime(source):
+            steps.append((source, obj))
+    def compile(step):
+        return subprocess.call([build['compiler'], '-c', step[0], '-o', step[1]])
+    pool = ThreadPool(jobs)
+    try:
+        for i, return_code in enumerate(pool.imap(compile, steps)):
+            print('[{{0:3}}%] Building CXX object {{1}}'.format(100 * (i + 1) // len(steps), steps[i][1]))
+            sys.stdout.flush()
+            if 0 != return_code:
+                print('{{0}}: *** [{{1}}] Error 1'.format(tool, steps[i][1]))
+                return 2
+    finally:
+        pool.close()
+        pool.join()
+    if steps or not os.path.exists('program'):
+        print('[100%] Linking CXX executable program')
+        subprocess.call([build['compiler'], '-o', 'program'])
+    elif 'ninja' == tool:
+        print('ninja: no work to do.')
+    if 'install' in args:
+        print('Install the project...')
+        print('-- Installing: {{0}}'.format(os.path.abspath('program')))
+        with open('install_manifest.txt', 'w') as f:
+            f.write(os.path.abspath('program'))
+    return 0
+
+def main():
+    tool, args = os.path.basename(sys.argv[0]), sys.argv[1:]
+    if '--version' in args:
+        print(VERSIONS[tool])
+        return 0
+    if 'cmake' == tool:
+        return run_cmake(args)
+    return run_build(tool, args)
+
+sys.exit(main())
+'''
+
+STUB_COMPILER = '''#!/bin/sh
+# stub compiler of bench_build.py, writes an empty output file after BENCH_STUB_COMPILE_SECONDS
+case "$1" in --version) echo "gcc (GCC) 12.2.0"; exit 0;; esac
+out=""
+prev=""
+for arg in "$@"; do
+    [ "$prev" = "-o" ] && out="$arg"
+    prev="$arg"
+done
+[ -n "$BENCH_STUB_COMPILE_SECONDS" ] && sleep "$BENCH_STUB_COMPILE_SECONDS"
+[ -n "$out" ] && : > "$out"
+exit 0
+'''
+
+
+def write_executable(path, content):
+    with open(path, 'w') as f:
+        f.write(content)
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+
+def create_stub_tools(bin_dir):
+    '''
+    create stub cmake, make, ninja, git && compilers in bin_dir
+    '''
+    os.makedirs(bin_dir)
+    write_executable(os.path.join(bin_dir, 'stub_build_tool'), \
+        STUB_BUILD_TOOL.format(python = sys.executable, stub_build_file = STUB_BUILD_FILE))
+    write_executable(os.path.join(bin_dir, 'stub_compiler'), STUB_COMPILER)
+    for name in ['cmake', 'make', 'ninja', 'git']:
+        os.symlink('stub_build_tool', os.path.join(bin_dir, name))
+    for name in ['gcc', 'cc', 'g++', 'c++']:
+        os.symlink('stub_compiler', os.path.join(bin_dir, name))
+
+
+def create_project(project_dir, n_sources):
+    '''
+    create synthetic cmake project with n_sources translation units
+    '''
+    os.makedirs(os.path.join(project_dir, 'src'))
+    sources = ['src/unit_{0}.cpp'.format(i) for i in range(n_sources)]
+    for i, source in enumerate(sources):
+        with open(os.path.join(project_dir, source), 'w') as f:
+            f.write('int unit_{0}() {{ return {0}; }}\n'.format(i))
+    with open(os.path.join(project_dir, 'CMakeLists.txt'), 'w') as f:
+        f.write('cmake_minimum_required(VERSION 3.10)\nproject(synthetic CXX)\nadd_executable(program\n    {0}\n)\ninstall(TARGETS program DESTINATION bin)\n'.format( \
+            '\n    '.join(sources)))
+    return sources
+
+
+def run_builder(project_dir, build_tool, jobs, env, extra_args, work_dir):
+    '''
+    run build.py on project_dir, return measurement of the run
+    '''
+    report_file = os.path.join(work_dir, 'build_report.json')
+    if os.path.exists(report_file):
+        os.remove(report_file)
+    command = [sys.executable, BUILD_SCRIPT, 'install', '-n', '-s', project_dir, '-t', build_tool, '-j', str(jobs), \
+        '--report', 'json', '--report-file', report_file] + extra_args
+    with open(os.devnull, 'w') as devnull:
+        start = time.time()
+        process = subprocess.Popen(command, env = env, stdout = devnull, stderr = subprocess.PIPE, universal_newlines = True)
+        _, stderr = process.communicate()
+        wall_seconds = time.time() - start
+    if 0 != process.returncode:
+        raise Exception('{0} failed with exit code {1} :\n{2}'.format(command, process.returncode, stderr[-4000:]))
+    with open(report_file, 'r') as f:
+        report = json.load(f)
+    return {
+        'wall_seconds': wall_seconds,
+        'total_seconds': report['total_seconds'],
+        'phases': dict((phase['name'], phase['seconds']) for phase in report['phases']),
+    }
+
+
+def best_run(runs):
+    return min(runs, key = lambda run : run['wall_seconds'])
+
+
+def bench_build_scenarios(sizes, build_tools, jobs, repeat, env, work_dir):
+    '''
+    cold, warm && no-op builds of every project size with every build tool
+    '''
+    results = []
+    for n_sources in sizes:
+        for build_tool in build_tools:
+            project_dir = os.path.join(work_dir, 'project_{0}_{1}'.format(n_sources, build_tool))
+            sources = create_project(project_dir, n_sources)
+            scenarios = {'cold': [], 'warm': [], 'no-op': []}
+            for i in range(repeat):
+                scenarios['cold'].append(run_builder(project_dir, build_tool, jobs, env, ['--rebuild', '--reconfigure'], work_dir))
+                with open(os.path.join(project_dir, sources[0]), 'a') as f:
+                    f.write('// changed {0}\n'.format(i))
+                scenarios['warm'].append(run_builder(project_dir, build_tool, jobs, env, [], work_dir))
+                scenarios['no-op'].append(run_builder(project_dir, build_tool, jobs, env, [], work_dir))
+            shutil.rmtree(project_dir)
+            for name in ['cold', 'warm', 'no-op']:
+                result = best_run(scenarios[name])
+                result.update({'sources': n_sources, 'build_tool': build_tool, 'jobs': jobs, 'scenario': name})
+                results.append(result)
+                print(' * {0:6} sources {1:6} {2:6} {3:8.3f}s  {4}'.format(n_sources, build_tool, name, result['wall_seconds'], \
+                    ', '.join('{0} {1:.3f}s'.format(k, v) for k, v in sorted(result['phases'].items()))))
+    return results
+
+
+def bench_jobs_scaling(n_sources, jobs_list, compile_seconds, repeat, env, work_dir):
+    '''
+    cold builds with each --jobs, every translation unit takes compile_seconds
+    '''
+    env = dict(env, BENCH_STUB_COMPILE_SECONDS = str(compile_seconds))
+    project_dir = os.path.join(work_dir, 'project_jobs')
+    create_project(project_dir, n_sources)
+    results = []
+    for jobs in jobs_list:
+        result = best_run([run_builder(project_dir, 'make', jobs, env, ['--rebuild'], work_dir) for i in range(repeat)])
+        result.update({'sources': n_sources, 'jobs': jobs, 'compile_seconds': compile_seconds})
+        results.append(result)
+        print(' * {0:6} sources -j {1:<4} {2:8.3f}s  compile {3:.3f}s'.format(n_sources, jobs, result['wall_seconds'], result['phases'].get('compile', 0.0)))
+    shutil.rmtree(project_dir)
+    return results
+
+
+def bench_output_memory(line_counts, line_length):
+    '''
+    peak python memory of run_shell_command reading a command printing line_count lines, with && without capture
+    '''
+    import tracemalloc
+    sys.path.insert(0, REPO_DIR)
+    from build import CMakeCPPBuilder
+    builder = CMakeCPPBuilder()
+    results = []
+    for line_count in line_counts:
+        command = [sys.executable, '-c', 'import sys\nline = "x" * {0} + "\\n"\nfor i in range({1}):\n    sys.stdout.write(line)'.format(line_length - 1, line_count)]
+        for capture in [True, False]:
+            tracemalloc.start()
+            start = time.time()
+            stdout, _ = builder.run_shell_command(command, log_info = False, capture = capture)
+            seconds = time.time() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del stdout
+            results.append({'lines': line_count, 'line_length': line_length, 'capture': capture, 'seconds': seconds, 'peak_kb': peak // 1024})
+            print(' * {0:8} lines capture={1!s:5} {2:8.3f}s {3:10}KB'.format(line_count, capture, seconds, peak // 1024))
+    return results
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd = REPO_DIR, universal_newlines = True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_int_list(value):
+    return [int(v) for v in value.split(',') if v]
+
+
+def main():
+    from argparse import ArgumentParser
+    parser = ArgumentParser(description = 'benchmark of build.py with synthetic projects && stub toolchain')
+    parser.add_argument('--sizes', help='''comma separated translation unit counts of synthetic projects, default is 1,10,100,1000,5000''', \
+        default=[1, 10, 100, 1000, 5000], type=parse_int_list)
+    parser.add_argument('--build-tools', help='''comma separated build tools, default is make,ninja''', default='make,ninja')
+    parser.add_argument('--jobs', help='''--jobs of build scenarios, default is 4''', default=4, type=int)
+    parser.add_argument('--jobs-scaling', help='''comma separated --jobs to measure scaling with, default is 1,2,4,8''', \
+        default=[1, 2, 4, 8], type=parse_int_list)
+    parser.add_argument('--jobs-scaling-sources', help='''translation units of jobs scaling project, default is 200''', default=200, type=int)
+    parser.add_argument('--compile-seconds', help='''compile time of each translation unit in jobs scaling, default is 0.01''', default=0.01, type=float)
+    parser.add_argument('--output-lines', help='''comma separated output line counts for run_shell_command memory, default is 10000,100000,1000000''', \
+        default=[10000, 100000, 1000000], type=parse_int_list)
+    parser.add_argument('--repeat', help='''runs of each measurement, best one is taken, default is 3''', default=3, type=int)
+    parser.add_argument('--output', help='''json result file, default is bench_results.json''', default='bench_results.json')
+    parser.add_argument('--keep-work-dir', help='''keep synthetic projects && stub tools''', default=False, action='store_true')
+    arguments = parser.parse_args()
+    if not sys.platform.startswith('linux'):
+        print('bench_build.py runs on linux only')
+        return 1
+    work_dir = tempfile.mkdtemp(prefix = 'bench_build_')
+    bin_dir = os.path.join(work_dir, 'bin')
+    create_stub_tools(bin_dir)
+    env = dict(os.environ)
+    env['PATH'] = bin_dir + os.pathsep + env.get('PATH', '')
+    env['XDG_CACHE_HOME'] = os.path.join(work_dir, 'cache') # keep tool version cache && artifact cache of stubs away from user's
+    env.pop('BENCH_STUB_COMPILE_SECONDS', None)
+    try:
+        print('# build scenarios')
+        scenarios = bench_build_scenarios(arguments.sizes, arguments.build_tools.split(','), arguments.jobs, arguments.repeat, env, work_dir)
+        print('# jobs scaling')
+        jobs_scaling = bench_jobs_scaling(arguments.jobs_scaling_sources, arguments.jobs_scaling, arguments.compile_seconds, arguments.repeat, env, work_dir)
+        print('# run_shell_command memory')
+        output_memory = bench_output_memory(arguments.output_lines, 100)
+    finally:
+        if arguments.keep_work_dir:
+            print('work directory kept at {0}'.format(work_dir))
+        else:
+            shutil.rmtree(work_dir)
+    results = {
+        'version': 1,
+        'commit': get_commit(),
+        'python': sys.version.split()[0],
+        'finished_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'scenarios': scenarios,
+        'jobs_scaling': jobs_scaling,
+        'output_memory': output_memory,
+    }
+    with open(arguments.output, 'w') as f:
+        json.dump(results, f, indent = 4, sort_keys = True)
+    print('results written to {0}'.format(arguments.output))
+    return 0
+
+
+if '__main__' == __name__:
+    sys.exit(main())
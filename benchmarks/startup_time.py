@@ -0,0 +1,130 @@
+#!/usr/bin/python
+#-*-encoding:utf-8-*-
+'''
+startup time benchmark of build.py, fails when import of build.py or build.py --version takes more than a margin over the baseline,
+baseline is import of standard modules build.py imports at module level, measured in same run on same machine
+
+    python benchmarks/startup_time.py [--margin-ms 15] [--output startup_time.json]
+'''
+from __future__ import print_function
+import os, sys, subprocess, time, json, tempfile
+
+BUILD_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'build.py')
+# import time of build module && time of --version allowed over baseline, in milliseconds,
+# imports of logging, traceback, argparse, ... exceed it
+DEFAULT_IMPORT_MARGIN_MS = 15
+# standard modules build.py may import at module level, their import is the baseline,
+# any other module imported at module level counts against the margin
+BASELINE_MODULES = ['os', 'sys', 'time', 're', 'threading', 'json', 'collections']
+
+
+def measure_import_time(repeat):
+    '''
+    best import time of baseline modules, best import time of build module once they are imported && slowest imports of it,
+    by python -X importtime
+    '''
+    statement = 'import {0}; import build'.format(', '.join(BASELINE_MODULES))
+    best_baseline, best, best_imports = None, None, None
+    for i in range(repeat):
+        process = subprocess.Popen([sys.executable, '-X', 'importtime', '-c', statement], \
+            cwd = os.path.dirname(BUILD_SCRIPT), stdout = subprocess.PIPE, stderr = subprocess.PIPE, universal_newlines = True)
+        _, stderr = process.communicate()
+        baseline, build_us, nested = 0, None, []
+        for line in stderr.splitlines():
+            if not line.startswith('import time:') or line.count('|') != 2:
+                continue
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            if not self_us.strip().isdigit(): # header
+                continue
+            if name.startswith('  '): # imported by a module, which is listed after it
+                nested.append((int(cumulative_us), name.strip()))
+            elif 'build' == name.strip():
+                build_us, build_imports = int(cumulative_us), nested
+            else:
+                baseline += int(cumulative_us)
+                nested = []
+        if build_us is None:
+            raise Exception('build module not imported : {0}'.format(stderr))
+        best_baseline = baseline if best_baseline is None else min(best_baseline, baseline)
+        if best is None or build_us < best:
+            best, best_imports = build_us, build_imports
+    slowest = sorted(best_imports, reverse=True)[:10]
+    return best_baseline / 1000.0, best / 1000.0, [(name, us / 1000.0) for us, name in slowest]
+
+
+def measure_command_time(command, repeat, cwd = None):
+    '''
+    best wall time of command in milliseconds
+    '''
+    best = None
+    with open(os.devnull, 'w') as devnull:
+        for i in range(repeat):
+            start = time.time()
+            return_code = subprocess.call(command, cwd = cwd, stdout = devnull, stderr = devnull)
+            elapsed = (time.time() - start) * 1000.0
+            if 0 != return_code:
+                raise Exception('{0} failed with exit code {1}'.format(command, return_code))
+            best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    from argparse import ArgumentParser
+    parser = ArgumentParser(description = 'startup time benchmark of build.py')
+    parser.add_argument('--margin-ms', help='''import time of build.py && time of build.py --version allowed over baseline,
+default is {0}'''.format(DEFAULT_IMPORT_MARGIN_MS), \
+        default=DEFAULT_IMPORT_MARGIN_MS, type=float)
+    parser.add_argument('--repeat', help='''runs of each measurement, best one is taken''', default=10, type=int)
+    parser.add_argument('--output', help='''write results into this json file''', default=None)
+    arguments = parser.parse_args()
+    if sys.version_info < (3, 7):
+        print('python -X importtime needs python 3.7 or later, skipped')
+        return 0
+    import py_compile
+    compiled_script = py_compile.compile(BUILD_SCRIPT, doraise = True) # measure warm imports, even with PYTHONDONTWRITEBYTECODE set
+    baseline_ms, import_ms, slowest = measure_import_time(arguments.repeat)
+    # python -m build runs warm bytecode of build.py, as docker builds do, python build.py compiles it on every run
+    build_dir = os.path.dirname(BUILD_SCRIPT)
+    baseline_command_ms = measure_command_time([sys.executable, '-c', 'import {0}'.format(', '.join(BASELINE_MODULES))], arguments.repeat)
+    version_ms = measure_command_time([sys.executable, '-m', 'build', '--version'], arguments.repeat, cwd = build_dir)
+    profile_log = tempfile.mktemp(suffix = '.log')
+    try:
+        results = {
+            'python': sys.version.split()[0],
+            'margin_ms': arguments.margin_ms,
+            'baseline_ms': baseline_ms,
+            'import_ms': import_ms,
+            'slowest_imports_ms': slowest,
+            'baseline_command_ms': baseline_command_ms,
+            'version_ms': version_ms,
+            'version_script_ms': measure_command_time([sys.executable, BUILD_SCRIPT, '--version'], arguments.repeat),
+            'profile_launcher_ms': measure_command_time([sys.executable, compiled_script, '--profile-launcher', profile_log, 'compile', \
+                sys.executable, '-c', 'pass'], arguments.repeat),
+        }
+    finally:
+        if os.path.exists(profile_log): # the launcher runs compiled build.py, as --profile-build does
+            os.remove(profile_log)
+    print(' * {0:20} {1:8.1f}ms'.format('import baseline', baseline_ms))
+    print(' * {0:20} {1:8.1f}ms (margin {2:.1f}ms over baseline)'.format('import build', import_ms, arguments.margin_ms))
+    print(' * {0:20} {1:8.1f}ms'.format('command baseline', baseline_command_ms))
+    print(' * {0:20} {1:8.1f}ms (margin {2:.1f}ms over baseline)'.format('-m build --version', version_ms, arguments.margin_ms))
+    print(' * {0:20} {1:8.1f}ms'.format('build.py --version', results['version_script_ms']))
+    print(' * {0:20} {1:8.1f}ms'.format('profile launcher', results['profile_launcher_ms']))
+    for name, ms in slowest:
+        print('   - {0:32} {1:8.1f}ms'.format(name, ms))
+    if arguments.output:
+        with open(arguments.output, 'w') as f:
+            json.dump(results, f, indent = 4)
+    failed = False
+    if import_ms > arguments.margin_ms:
+        print('[ERROR] import of build.py takes {0:.1f}ms over baseline, more than margin {1:.1f}ms'.format(import_ms, arguments.margin_ms))
+        failed = True
+    if version_ms - baseline_command_ms > arguments.margin_ms:
+        print('[ERROR] build.py --version takes {0:.1f}ms over baseline, more than margin {1:.1f}ms'.format( \
+            version_ms - baseline_command_ms, arguments.margin_ms))
+        failed = True
+    return 1 if failed else 0
+
+
+if '__main__' == __name__:
+    sys.exit(main())
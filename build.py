@@ -1,9 +1,174 @@
 #!/usr/bin/python
 #-*-encoding:utf-8-*-
 from __future__ import print_function
-import os, sys, shutil, subprocess, logging, time, re, platform, traceback
-from datetime import datetime
-from copy import copy
+# modules used only by some commands are imported where they are used, startup of --profile-launcher && --use-daemon stays short,
+# logging, traceback && hashlib included
+import os, sys, time, re, threading, json
+from collections import deque
+
+# version printed by --version, it is handled before argument parser && logger are set up
+VERSION = '0.1.0'
+
+# files written into build directory to remember last successful configure
+CONFIGURE_FINGERPRINT_FILE = 'build_configure.fingerprint'
+CONFIGURE_LOG_FILE = 'build_configure.log'
+# environment variables which affect cmake configure result
+CONFIGURE_ENV_KEYS = ['PATH', 'CC', 'CXX', 'CFLAGS', 'CXXFLAGS', 'CPPFLAGS', 'LDFLAGS', 'INCLUDE', 'LIB', 'LIBPATH']
+CONFIGURE_ENV_PREFIXES = ['CMAKE_']
+# search path variables of CONFIGURE_ENV_KEYS left out of artifact key, they hold absolute paths && toolchain found by them is
+# keyed by its version
+ARTIFACT_KEY_IGNORED_ENV_KEYS = ['PATH', 'INCLUDE', 'LIB', 'LIBPATH']
+# tools probed by check_build_environment, (name, command)
+TOOLS_TO_CHECK = [('CMake', 'cmake'), ('Git', 'git'), ('GNU Make', 'make'), ('Ninja', 'ninja'), \
+    ('GCC', 'gcc'), ('CC', 'cc'), ('g++', 'g++'), ('c++', 'c++')]
+# version patterns of tool --version output, first pattern matching exactly once wins
+TOOL_VERSION_PATTERNS = [
+    re.compile(r'\d+(?:\.\d+)+\s\d+\s\(Red\sHat\s[\.\-\w]+\)', re.IGNORECASE), # redhat e.g. gcc (GCC) 4.9.2 20150212 (Red Hat 4.9.2-6)
+    re.compile(r'\(Ubuntu\s[\.\-\~\w]+\)\s\d+(?:\.\d+)+\s\d+', re.IGNORECASE), # ubuntu e.g. gcc (Ubuntu 5.4.0-6ubuntu1~16.04.11) 5.4.0 20160609
+    re.compile(r'\d+(?:\.\d+)+(?:[\.\-]?\w+)+', re.IGNORECASE), # e.g. git version 1.7.windows.1
+    re.compile(r'\d+(?:\.\d+)+'), # common version , e.g. 3.1.1
+]
+# tool version cache file in cache directory, keyed by resolved tool path && mtime
+TOOL_CACHE_FILE = 'tool_versions.json'
+# compiler cache launchers in order of preference
+COMPILER_CACHE_LAUNCHERS_LIN = ['ccache', 'sccache']
+COMPILER_CACHE_LAUNCHERS_WIN = ['sccache', 'ccache']
+# (hits, misses) patterns of compiler cache --show-stats output
+COMPILER_CACHE_STATS_PATTERNS = {
+    'sccache': (re.compile(r'^Cache hits\s+(\d+)\s*$', re.MULTILINE), re.compile(r'^Cache misses\s+(\d+)\s*$', re.MULTILINE)),
+    'ccache4': (re.compile(r'^  Hits:\s+(\d+)', re.MULTILINE), re.compile(r'^  Misses:\s+(\d+)', re.MULTILINE)),
+    'ccache3': (re.compile(r'^cache hit \(\w+\)\s+(\d+)', re.MULTILINE), re.compile(r'^cache miss\s+(\d+)', re.MULTILINE)),
+}
+# where compiler cache directory is mounted inside docker toolchain container
+DOCKER_COMPILER_CACHE_PATH = '/compiler_cache'
+# label put on persistent docker build containers, value is hash of container configuration
+DOCKER_CONTAINER_LABEL = 'cmake_cpp_builder.config'
+# build profile of --profile-build, written into build directory
+BUILD_PROFILE_LOG_FILE = 'build_profile.log'
+BUILD_PROFILE_TRACE_FILE = 'build_profile_trace.json'
+# first argument of build.py when it is invoked as timing launcher of --profile-build
+PROFILE_LAUNCHER_ARG = '--profile-launcher'
+# compiled copy of this script in build directory, run as compiler/linker launcher
+BUILD_LAUNCHER_FILE = 'build_launcher.pyc'
+OBJECT_FILE_EXTENSIONS = ('.o', '.obj')
+LINK_OUTPUT_EXTENSIONS = ('.a', '.so', '.lib', '.dll', '.exe', '.dylib')
+# cmake script applying --pch header to every target, written into build directory, included by CMAKE_PROJECT_INCLUDE
+PCH_SCRIPT_FILE = 'build_pch.cmake'
+PCH_SCRIPT = '''# generated by build.py --pch, precompiles CMAKE_CPP_BUILDER_PCH for every compiled target
+function(cmake_cpp_builder_add_pch dir)
+    get_property(targets DIRECTORY "${dir}" PROPERTY BUILDSYSTEM_TARGETS)
+    foreach(target IN LISTS targets)
+        get_target_property(type ${target} TYPE)
+        if(type MATCHES "^(EXECUTABLE|STATIC_LIBRARY|SHARED_LIBRARY|MODULE_LIBRARY|OBJECT_LIBRARY)$")
+            target_precompile_headers(${target} PRIVATE "${CMAKE_CPP_BUILDER_PCH}")
+        endif()
+    endforeach()
+    get_property(subdirs DIRECTORY "${dir}" PROPERTY SUBDIRECTORIES)
+    foreach(subdir IN LISTS subdirs)
+        cmake_cpp_builder_add_pch("${subdir}")
+    endforeach()
+endfunction()
+get_property(pch_deferred GLOBAL PROPERTY CMAKE_CPP_BUILDER_PCH_DEFERRED)
+if(NOT pch_deferred)
+    set_property(GLOBAL PROPERTY CMAKE_CPP_BUILDER_PCH_DEFERRED TRUE)
+    cmake_language(DEFER DIRECTORY "${CMAKE_SOURCE_DIR}" CALL cmake_cpp_builder_add_pch "${CMAKE_SOURCE_DIR}")
+endif()
+'''
+# compile times of full builds by unity build && pch settings, in cache directory, one file per source directory
+COMPILE_TIMES_DIR = 'compile_times'
+# first argument of build.py when it is invoked as compile/link launcher of resource scheduler
+SCHEDULE_LAUNCHER_ARG = '--schedule-launcher'
+# resource scheduler files in build directory : launcher configuration, throttled job log && job slot locks
+SCHEDULER_CONFIG_FILE = 'resource_scheduler.json'
+SCHEDULER_STATS_FILE = 'resource_scheduler_stats.log'
+SCHEDULER_LOCK_DIR = 'scheduler_locks'
+# memory pressure (avg10 of /proc/pressure/memory, in percent) above which new jobs are throttled
+SCHEDULER_MEMORY_PRESSURE_LIMIT = 20.0
+# load average per usable cpu above which new jobs are throttled
+SCHEDULER_LOAD_LIMIT = 1.5
+# seconds a throttled job waits before checking resources again
+SCHEDULER_POLL_INTERVAL = 0.5
+# first argument of build.py when it is invoked as compiler launcher of distributed build
+DISTRIBUTED_LAUNCHER_ARG = '--distributed-launcher'
+# distributed build files in build directory : launcher configuration, per job statistics && worker slot locks
+DISTRIBUTED_CONFIG_FILE = 'distributed_build.json'
+DISTRIBUTED_STATS_FILE = 'distributed_build_stats.log'
+DISTRIBUTED_LOCK_DIR = 'distributed_locks'
+# source files distributed build can preprocess && compile on workers, others are compiled locally
+DISTRIBUTED_SOURCE_EXTENSIONS = {'.c': 'cpp-output', '.cc': 'c++-cpp-output', '.cpp': 'c++-cpp-output', '.cxx': 'c++-cpp-output', '.c++': 'c++-cpp-output'}
+# cleaned build directory is renamed into this directory beside it && removed in background,
+# into this directory inside it if build directory is a mount point
+BUILD_TRASH_DIR = '.build_trash'
+# threads removing a trashed build directory, each one removes a sub tree
+TRASH_REMOVE_THREADS = 8
+# trash of a build process which can not be checked to be running is removed once it is this old, in seconds
+TRASH_STALE_SECONDS = 3600
+# stamp of last successful build in build directory, for skipping builds when nothing changed
+BUILD_STAMP_FILE = 'build_stamp.json'
+# log files written by setup_logger into source directory
+LOG_FILE_PATTERN = re.compile(r'^build_\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}\.log$')
+# default size limit of each artifact cache, in MB
+DEFAULT_ARTIFACT_CACHE_SIZE = 2048
+# default timeout of each test run by --test, in seconds
+DEFAULT_TEST_TIMEOUT = 300
+# seconds a timed out test has for exiting on SIGTERM before its process group is killed by SIGKILL
+TEST_KILL_GRACE_SECONDS = 5
+# list of packed files && their size/mtime written beside --package archive, for skipping unchanged packages
+PACKAGE_MANIFEST_SUFFIX = '.manifest.json'
+# size of data blocks of --package archive compressed in parallel, each one is a gzip member
+PACKAGE_BLOCK_SIZE = 1024 * 1024
+# max log records waiting for log writer thread, logging blocks when it is full
+LOG_QUEUE_SIZE = 10000
+# log file is flushed at most once in this many seconds
+LOG_FLUSH_INTERVAL = 1.0
+# errors listed in summary of a failed build step
+MAX_REPORTED_ERRORS = 20
+# framing of daemon output stream, each frame is type + 4 bytes big endian length/exit code + data
+DAEMON_FRAME_OUTPUT = b'O'
+DAEMON_FRAME_EXIT = b'X'
+# seconds build daemon waits for request line of an accepted client, a silent client must not stall other clients
+DAEMON_REQUEST_TIMEOUT = 5.0
+# memory reserved for each parallel compile job when deciding default job count, in MB
+DEFAULT_MEMORY_PER_JOB = 1024
+# lines of output kept from each pipe of a streamed (not captured) shell command
+OUTPUT_TAIL_LINES = 200
+# phase whose duration is below this in seconds is never reported as a regression
+REPORT_REGRESSION_MIN_SECONDS = 0.5
+# environment variable used to hand toolchain probe result to matrix build children, removed from environment of build commands,
+# it must not match CONFIGURE_ENV_PREFIXES, or it would change configure fingerprint
+TOOL_VERSIONS_ENV = 'BUILD_PY_TOOL_VERSIONS'
+
+
+try:
+    from os import scandir
+except ImportError: # python 2
+    class DirEntry(object):
+        def __init__(self, dir, name):
+            self.name = name
+            self.path = os.path.join(dir, name)
+        def is_dir(self, follow_symlinks=True):
+            return os.path.isdir(self.path) if follow_symlinks else (os.path.isdir(self.path) and not os.path.islink(self.path))
+        def stat(self):
+            return os.stat(self.path)
+    def scandir(path):
+        return [DirEntry(path, name) for name in os.listdir(path)]
+
+# monotonic clock for phase timing, time.monotonic is not available in python 2
+monotonic = getattr(time, 'monotonic', time.time)
+
+
+def host_system():
+    '''
+    same as platform.system() for the systems we build on, without importing platform
+    '''
+    if sys.platform.startswith('win'):
+        return 'Windows'
+    elif sys.platform.startswith('linux'):
+        return 'Linux'
+    elif 'darwin' == sys.platform:
+        return 'Darwin'
+    import platform
+    return platform.system()
 
 
 class ASimpleNameSpace(object):
@@ -17,49 +182,91 @@ class ASimpleNameSpace(object):
 
 
 class CMakeCPPBuilder(object):
-    def __init__(self):
+    def __init__(self, probed_toolchain = None):
+        '''
+        probed_toolchain is toolchain probe result of a parent build process, the toolchain is not probed again then
+        '''
         self.init_logger()
         self.env = os.environ.copy()
+        inherited_toolchain = self.env.pop(TOOL_VERSIONS_ENV, None)
+        self.probed_toolchain = probed_toolchain if probed_toolchain or not inherited_toolchain else json.loads(inherited_toolchain)
         
     def start(self, args = None):
         '''
         main entry for build
         '''
+        self.phase_timings = []
+        self.current_phase = None
+        self.report_finished = False
+        self.start_monotonic = monotonic()
+        self.diagnostics = DiagnosticsParser()
         try:
+            self.begin_phase('setup')
             self.parse_args(args = args)
             self.setup_logger()
-            if self.build_with_docker:
+            if getattr(self, 'daemon_child', False):
+                self.lock_build_dir()
+            if self.daemon:
+                self.start_daemon()
+            elif self.docker_prune:
+                self.prune_docker_container()
+            elif self.matrix:
+                if not self.build_with_docker:
+                    self.check_build_environment()
+                self.begin_phase('matrix_build')
+                self.start_build_matrix()
+            elif self.build_with_docker:
                 self.start_build_with_docker()
             else:
-                self.check_build_environment()
-                if 'Windows' == platform.system():
+                if 'Windows' == host_system():
                     self.configure_build_win()
-                    self.start_build_win()
+                    if not self.check_build_up_to_date():
+                        self.check_build_environment()
+                        if not self.restore_artifacts():
+                            self.start_build_win()
+                            self.store_artifacts()
+                    self.run_post_build_stages()
                     self.resotre_env()
-                elif 'Linux' == platform.system():
+                elif 'Linux' == host_system():
                     self.configure_build_lin()
-                    self.start_build_lin()
+                    if not self.check_build_up_to_date():
+                        self.check_build_environment()
+                        if not self.restore_artifacts():
+                            self.start_build_lin()
+                            self.store_artifacts()
+                    self.run_post_build_stages()
                     self.resotre_env()
+            self.finish_build_report('passed')
+            self.close_log_files()
         except Exception:
+            import traceback
             exc_type, exc_value, exc_traceback = sys.exc_info() # extract most recent Exception info fro sys
             self.logger.info('##############################################################################################')
             self.logger.info('# failed')
             self.logger.info('##############################################################################################')
             traceback.print_exception(exc_type, exc_value, exc_traceback, file=self.logger)
             self.logger.error('[ERROR] failed building {0} due to error above'.format(self.source_dir))
-            self.logger.error('see more in log file {0}'.format(self.logger.handlers[1].stream.name))
+            if getattr(self, 'log_file_path', None):
+                self.logger.error('see more in log file {0}'.format(self.log_file_path))
             self.logger.error('exit at {0}'.format(self.get_time_stamp()))
+            if hasattr(self, 'report') and not self.report_finished:
+                try:
+                    self.finish_build_report('failed')
+                except Exception as err:
+                    self.logger.error('[ERROR] failed writing build report : {0}'.format(err))
+            self.close_log_files()
             sys.exit(1)
             
     def parse_args(self, args = None):
+        import logging
         from argparse import ArgumentParser
         from argparse import RawTextHelpFormatter
 
         # prepare default configurations
-        if "Windows" == platform.system():
+        if "Windows" == host_system():
             self.build_tool = 'Visual Studio'
             self.build_dir = 'build_win'
-        elif "Linux" == platform.system():
+        elif "Linux" == host_system():
             self.build_tool = 'make'
             self.build_dir = 'build_lin'
         else:
@@ -79,12 +286,23 @@ class CMakeCPPBuilder(object):
 
         # arguments
         ### common
-        parser.add_argument('-v', '--version', help='version', action='version', version='0.1.0')
+        parser.add_argument('-v', '--version', help='version', action='version', version=VERSION)
         parser.add_argument('-vv', '--verbose', help='increase log verbose level', default=False, action='store_true')
         parser.add_argument('-n', '--no-log-file', help='do not generate log file', default=False, action='store_true')
+        parser.add_argument('--log-max-size', help='''rotate log file when it exceeds this size in MB, default is 0 (never rotate)''', default=0, type=int)
+        parser.add_argument('--log-compress', help='''gzip compress rotated log files''', default=False, action='store_true')
         parser.add_argument('-c', '--clean', help='''clean build directory after build is done,
 if you need to clean target, pass clean as a target''', default=False, action='store_true')
+        parser.add_argument('--fail-fast', help='''kill build process tree at first compile/link error instead of waiting for it to finish''', default=False, action='store_true')
         parser.add_argument('-C', '--rebuild', help='clean build directory before start build', default=False, action='store_true')
+        parser.add_argument('-F', '--reconfigure', help='''remove CMakeCache.txt && run full cmake configure,
+by default cmake is skipped if configure fingerprint not changed''', default=False, action='store_true')
+        parser.add_argument('--report', help='''write build performance report (phase timings, child process cpu time && peak rss),
+only json is supported''', default=None, choices=['json'])
+        parser.add_argument('--report-file', help='''path of build performance report, default is build_report.json in source directory''', default=None)
+        parser.add_argument('--report-baseline', help='''build performance report to compare with,
+build fails if any phase is slower than baseline by more than --report-tolerance''', default=None)
+        parser.add_argument('--report-tolerance', help='''allowed phase slow down against --report-baseline in percent, default is 20''', default=20.0, type=float)
         ### build
         build = parser.add_argument_group('build configurations')
         build.add_argument('-d', '--Debug', help='build Debug target', default=False, action='store_true')
@@ -94,6 +312,36 @@ if you need to clean target, pass clean as a target''', default=False, action='s
         build.add_argument('-t', '--build-tool', help='''build toot, the target cmake generate for,
 default Windows build tool is Visual Studio,
 default Linux build tool is GNU make''', default=None)
+        build.add_argument('-j', '--jobs', help='''number of parallel build jobs,
+default is usable cpu count (affinity && cgroup quota aware), capped by available memory''', default=None, type=int)
+        build.add_argument('--memory-per-job', help='''memory in MB reserved for each build job when deciding default jobs,
+default is {0}'''.format(DEFAULT_MEMORY_PER_JOB), default=DEFAULT_MEMORY_PER_JOB, type=int)
+        build.add_argument('--compiler-cache', help='''use compiler cache as compiler launcher : auto[default when no value given] ccache sccache,
+auto prefers ccache on linux && sccache on windows''', default=None, nargs='?', const='auto', choices=['auto', 'ccache', 'sccache'])
+        build.add_argument('--compiler-cache-dir', help='''directory of compiler cache,
+default is compiler_cache in user cache directory''', default=None)
+        build.add_argument('--matrix-build-types', help='''build matrix, comma separated build types, e.g. Debug,Release,RelWithDebInfo,
+every configuration of the matrix is built concurrently in its own build directory''', default=None)
+        build.add_argument('--matrix-build-tools', help='''build matrix, comma separated build tools, e.g. make,ninja''', default=None)
+        build.add_argument('--matrix-build-directory', help='''build directory pattern of each matrix configuration,
+default is {build_directory}_{build_tool}_{build_type}''', default='{build_directory}_{build_tool}_{build_type}')
+        build.add_argument('--profile-build', help='''profile compile && link steps (linux only), report slowest steps && critical path,
+a chrome trace is written to {0} in build directory'''.format(BUILD_PROFILE_TRACE_FILE), default=False, action='store_true')
+        build.add_argument('--profile-top', help='''number of slowest steps reported by --profile-build, default is 10''', default=10, type=int)
+        build.add_argument('--unity-build', help='''unity (jumbo) build, source files are compiled in batches of this size, 8 if no size given''', \
+            default=None, nargs='?', const=8, type=int)
+        build.add_argument('--pch', help='''header precompiled for every target, relative to source directory, needs cmake 3.19''', default=None)
+        build.add_argument('--resource-scheduler', help='''throttle new compile && link jobs under memory pressure, low memory or high load average (linux only),
+reported in build summary''', default=False, action='store_true')
+        build.add_argument('--link-jobs', help='''max concurrent link steps with --resource-scheduler,
+default is derived from available memory && --memory-per-job''', default=None, type=int)
+        build.add_argument('--always-build', help='''always run build, by default the whole build is skipped when source tree,
+build commands && toolchain are not changed since last build''', default=False, action='store_true')
+        build.add_argument('--artifact-cache', help='''artifact cache restoring installed files of an identical earlier build instead of building,
+[<backend>:]<location>, backend is dir[default] (a local or shared directory),
+can be given multiple times, caches are looked up in order && all of them are filled''', default=[], action='append')
+        build.add_argument('--artifact-cache-size', help='''size limit of each artifact cache in MB, least recently used artifacts are evicted,
+default is {0}'''.format(DEFAULT_ARTIFACT_CACHE_SIZE), default=DEFAULT_ARTIFACT_CACHE_SIZE, type=int)
         build.add_argument('-s', '--source-directory', help='source directory, where CMakeLists.txt lies', default=os.getcwd())
         build.add_argument('-w', '--build-directory', help='''build directory, which will be create and used 
 as work directory alongside CMakeLists.txt lies''', default=None)
@@ -105,6 +353,37 @@ as work directory alongside CMakeLists.txt lies''', default=None)
 default is davied9/dpc_build_toolchain_centos:latest''', default='davied9/dpc_build_toolchain_centos:latest')
         docker.add_argument('-W', '--docker-mapped-path', help='''where source directory is to be mounted inside the docker image,
 default is /build_area''', default='/build_area')
+        docker.add_argument('-P', '--docker-persistent', help='''keep a persistent toolchain container && build in it with docker exec,
+build directory && compiler cache are kept in named docker volumes''', default=False, action='store_true')
+        docker.add_argument('--docker-container-name', help='''name of persistent toolchain container,
+default is derived from source directory && toolchain image''', default=None)
+        docker.add_argument('--docker-prune', help='''remove persistent toolchain container && its volumes, then exit''', default=False, action='store_true')
+        ### distributed
+        distributed = parser.add_argument_group('distributed build configurations')
+        distributed.add_argument('--distributed-workers', help='''comma separated workers compile jobs are distributed to, linking stays local (linux only),
+each is [<transport>:]<host>[*<slots>], transport is local, ssh or docker, e.g. ssh:user@build1*8,local*2,docker*4,
+docker workers are containers of --docker-toolchain-image, so all workers use same toolchain''', default=None)
+        distributed.add_argument('--distributed-cache', help='''content addressed object cache shared by distributed build, [<backend>:]<location>,
+default is objects in user cache directory''', default=None)
+        distributed.add_argument('--distributed-cache-size', help='''size limit of distributed object cache in MB,
+default is {0}'''.format(DEFAULT_ARTIFACT_CACHE_SIZE), default=DEFAULT_ARTIFACT_CACHE_SIZE, type=int)
+        ### daemon
+        daemon = parser.add_argument_group('daemon configurations')
+        daemon.add_argument('--daemon', help='''run build daemon, it keeps toolchain info && serves builds handed over by --use-daemon (linux only)''', default=False, action='store_true')
+        daemon.add_argument('--use-daemon', help='''hand this build over to build daemon && stream its output, build locally if no daemon is running''', default=False, action='store_true')
+        daemon.add_argument('--daemon-stop', help='''stop build daemon''', default=False, action='store_true')
+        daemon.add_argument('--daemon-socket', help='''unix socket of build daemon, default is daemon.sock in user cache directory''', default=None)
+        ### test && package
+        stage = parser.add_argument_group('test && package configurations')
+        stage.add_argument('--test', help='''run tests after build, by ctest if build directory has tests registered by add_test,
+else test executables found by --test-pattern or installed by install target, --jobs tests run in parallel''', default=False, action='store_true')
+        stage.add_argument('--test-pattern', help='''glob of test executables relative to source directory, e.g. packages/*_test,
+can be given multiple times''', default=[], action='append')
+        stage.add_argument('--test-timeout', help='''timeout of each test in seconds, default is {0}'''.format(DEFAULT_TEST_TIMEOUT), default=DEFAULT_TEST_TIMEOUT, type=int)
+        stage.add_argument('--test-junit', help='''junit xml report of tests, default is test_results.xml in source directory''', default=None)
+        stage.add_argument('--package', help='''pack installed files into gzip compressed tar archive after build, relative to source directory,
+default is out_packages.tar.gz, packing is skipped if packed files not changed''', default=None, nargs='?', const='out_packages.tar.gz')
+        stage.add_argument('--package-directory', help='''directory packed by --package instead of installed files, relative to source directory''', default=None)
         ### linux
         linux = parser.add_argument_group('linux configurations')
         ### windows
@@ -129,6 +408,10 @@ Visual Studio 2012 [specify 2012 or 11 as MSVC_VERSION]
         n_build_type_flags += 1 if arguments.build_type != 'Release' else 0
         if n_build_type_flags > 1:
             raise Exception('too many build flags are set')
+        if arguments.matrix_build_types and n_build_type_flags > 0:
+            raise Exception('build flags can not be used with --matrix-build-types')
+        if (arguments.matrix_build_types or arguments.matrix_build_tools) and (arguments.test or arguments.package):
+            raise Exception('--test && --package can not be used with matrix build')
         ### replace path separator with '/'
         arguments.source_directory = arguments.source_directory.replace(os.path.sep, '/')
         arguments.build_directory = arguments.build_directory.replace(os.path.sep, '/') if arguments.build_directory else None
@@ -138,8 +421,17 @@ Visual Studio 2012 [specify 2012 or 11 as MSVC_VERSION]
         ### common
         self.logger.level = logging.DEBUG if arguments.verbose else logging.INFO
         self.no_log_file = arguments.no_log_file
+        self.log_max_size = arguments.log_max_size
+        self.log_compress = arguments.log_compress
         self.clean_after_build = arguments.clean # cleanup build directory after done build
         self.clean_before_build = arguments.rebuild # cleanup build directory before start build
+        self.reconfigure = arguments.reconfigure # ignore configure fingerprint, always run full cmake configure
+        self.fail_fast = arguments.fail_fast
+        self.report = arguments.report
+        self.report_file = arguments.report_file.replace(os.path.sep, '/') if arguments.report_file else \
+            arguments.source_directory + '/build_report.json'
+        self.report_baseline = arguments.report_baseline
+        self.report_tolerance = arguments.report_tolerance
         ### build
         self.build_type = arguments.build_type # Release Debug RelWithDebInfo RelMinSize
         if arguments.Debug:
@@ -152,15 +444,67 @@ Visual Studio 2012 [specify 2012 or 11 as MSVC_VERSION]
         self.source_dir = arguments.source_directory
         self.build_dir = self.source_dir + '/' + ( arguments.build_directory if arguments.build_directory else self.build_dir )
         self.target_architecture = 'x64'
+        self.distributed_workers = parse_distributed_workers(arguments.distributed_workers) if arguments.distributed_workers else []
+        self.distributed_cache = arguments.distributed_cache if arguments.distributed_cache else 'dir:' + os.path.join(get_cache_dir(), 'objects')
+        self.distributed_cache_size = arguments.distributed_cache_size
+        self.distributed_config = None
+        if arguments.jobs:
+            self.jobs = arguments.jobs
+        elif self.distributed_workers:
+            self.jobs = sum(worker['slots'] for worker in self.distributed_workers)
+        else:
+            self.jobs = self.detect_default_jobs(arguments.memory_per_job)
+        if self.jobs < 1:
+            raise Exception('jobs should be at least 1')
+        self.profile_build = arguments.profile_build
+        self.unity_build = arguments.unity_build
+        if self.unity_build is not None and self.unity_build < 1:
+            raise Exception('unity build batch size should be at least 1')
+        self.pch = os.path.join(self.source_dir, arguments.pch).replace(os.path.sep, '/') if arguments.pch else None
+        self.resource_scheduler = arguments.resource_scheduler
+        self.link_jobs = arguments.link_jobs
+        self.memory_per_job = arguments.memory_per_job
+        self.scheduler_config = None
+        self.always_build = arguments.always_build
+        ### test && package
+        self.test = arguments.test
+        self.test_patterns = arguments.test_pattern
+        self.test_timeout = arguments.test_timeout
+        self.test_junit = os.path.join(self.source_dir, arguments.test_junit if arguments.test_junit else 'test_results.xml').replace(os.path.sep, '/')
+        self.package = os.path.join(self.source_dir, arguments.package).replace(os.path.sep, '/') if arguments.package else None
+        self.package_directory = os.path.join(self.source_dir, arguments.package_directory).replace(os.path.sep, '/') \
+            if arguments.package_directory else None
+        self.artifact_caches = [create_artifact_cache(spec, arguments.artifact_cache_size) for spec in arguments.artifact_cache]
+        self.profile_top = arguments.profile_top
+        self.compiler_cache = arguments.compiler_cache # None, auto, ccache or sccache
+        self.compiler_cache_dir = arguments.compiler_cache_dir.replace(os.path.sep, '/') if arguments.compiler_cache_dir \
+            else os.path.join(get_cache_dir(), 'compiler_cache').replace(os.path.sep, '/')
         ### docker
         self.build_with_docker = arguments.build_with_docker
         self.docker_toolchain_image = arguments.docker_toolchain_image # if specified, docker toolchain will be used as build toolchain
         self.docker_mapped_path = arguments.docker_mapped_path
+        self.docker_persistent = arguments.docker_persistent
+        self.daemon = arguments.daemon
+        self.daemon_socket = arguments.daemon_socket if arguments.daemon_socket else get_daemon_socket()
+        self.docker_prune = arguments.docker_prune
+        self.docker_build_directory = arguments.build_directory if arguments.build_directory else 'build_lin' # toolchain container is linux
+        self.docker_container_name = arguments.docker_container_name # default is decided by get_docker_container_name
         ### linux
         ### windows
         self.msvc_version = int(arguments.msvc_version)
         ### target
         self.targets = arguments.targets
+        ### matrix
+        self.matrix = []
+        if arguments.matrix_build_types or arguments.matrix_build_tools:
+            build_types = arguments.matrix_build_types.split(',') if arguments.matrix_build_types else [self.build_type]
+            build_tools = arguments.matrix_build_tools.split(',') if arguments.matrix_build_tools else [self.build_tool]
+            build_directory = arguments.build_directory if arguments.build_directory else os.path.basename(self.build_dir)
+            for build_tool in build_tools:
+                for build_type in build_types:
+                    self.matrix.append((build_type, build_tool, arguments.matrix_build_directory.format( \
+                        build_directory = build_directory, build_tool = build_tool.replace(' ', '_'), build_type = build_type)))
+        self.raw_args = list(args) if args is not None else sys.argv[1:]
         
         # make docker argument
         docker_arguments = ''
@@ -170,9 +514,27 @@ Visual Studio 2012 [specify 2012 or 11 as MSVC_VERSION]
             docker_arguments += ' --no-log-file '
             docker_arguments += ' --clean ' if arguments.clean else ''
             docker_arguments += ' --rebuild ' if arguments.rebuild else ''
+            docker_arguments += ' --reconfigure ' if arguments.reconfigure else ''
+            docker_arguments += ' --fail-fast ' if arguments.fail_fast else ''
             ### build
             docker_arguments += ' --build-type ' + self.build_type
             docker_arguments += ' --build-tool "{0}" '.format(arguments.build_tool) if arguments.build_tool else ''
+            docker_arguments += ' --jobs {0} '.format(self.jobs)
+            docker_arguments += ' --always-build ' if self.always_build else ''
+            docker_arguments += ' --profile-build --profile-top {0} '.format(self.profile_top) if self.profile_build else ''
+            docker_arguments += ' --unity-build {0} '.format(self.unity_build) if self.unity_build else ''
+            docker_arguments += ' --pch "{0}" '.format(os.path.relpath(self.pch, self.source_dir).replace(os.path.sep, '/')) if self.pch else ''
+            docker_arguments += ' --resource-scheduler --memory-per-job {0} '.format(self.memory_per_job) if self.resource_scheduler else ''
+            docker_arguments += ' --link-jobs {0} '.format(self.link_jobs) if self.resource_scheduler and self.link_jobs else ''
+            ### test && package, paths relative to source directory
+            docker_arguments += ' --test --test-timeout {0} '.format(self.test_timeout) if self.test else ''
+            docker_arguments += ''.join(' --test-pattern "{0}" '.format(pattern) for pattern in self.test_patterns)
+            docker_arguments += ' --test-junit "{0}" '.format(os.path.relpath(self.test_junit, self.source_dir).replace(os.path.sep, '/')) if self.test else ''
+            docker_arguments += ' --package "{0}" '.format(os.path.relpath(self.package, self.source_dir).replace(os.path.sep, '/')) if self.package else ''
+            docker_arguments += ' --package-directory "{0}" '.format(os.path.relpath(self.package_directory, self.source_dir).replace(os.path.sep, '/')) \
+                if self.package_directory else ''
+            #   compiler cache directory is mounted at DOCKER_COMPILER_CACHE_PATH
+            docker_arguments += ' --compiler-cache {0} --compiler-cache-dir "{1}" '.format(self.compiler_cache, DOCKER_COMPILER_CACHE_PATH) if self.compiler_cache else ''
             #   in docker image, source directory is where source directory is mapped
             docker_arguments += ' --source-directory "{0}" '.format(arguments.docker_mapped_path)
             docker_arguments += ' --build-directory "{0}" '.format(arguments.build_directory)  if arguments.build_directory else ''
@@ -184,6 +546,191 @@ Visual Studio 2012 [specify 2012 or 11 as MSVC_VERSION]
                 docker_arguments += ' ' + t
         self.docker_arguments = docker_arguments
         
+    ##############################################################################################
+    # matrix build procedure
+    ##############################################################################################
+    def start_build_matrix(self):
+        '''
+        entry for matrix build, every configuration is built by a child build process in its own build directory,
+        all children share toolchain probe of this process && the global jobs budget
+        '''
+        self.log_build_configuration()
+        n_parallel = min(len(self.matrix), self.jobs)
+        jobs_per_configuration = max(1, self.jobs // n_parallel)
+        self.logger.info('##############################################################################################')
+        self.logger.info('# building {0} configurations, {1} in parallel with {2} jobs each'.format(len(self.matrix), n_parallel, jobs_per_configuration))
+        self.logger.info('##############################################################################################')
+        child_env = self.env.copy()
+        if hasattr(self, 'tool_versions'):
+            child_env[TOOL_VERSIONS_ENV] = json.dumps({'tool_versions': self.tool_versions, 'full_version_check_log': self.full_version_check_log})
+        # build type, build tool, build directory && jobs of each child are given below
+        base_args = strip_arguments(self.raw_args, ['--matrix-build-types', '--matrix-build-tools', '--matrix-build-directory', \
+            '-T', '--build-type', '-t', '--build-tool', '-w', '--build-directory', '-j', '--jobs', \
+            '--report', '--report-file', '--report-baseline', '--report-tolerance'], \
+            ['-d', '--Debug', '-R', '--RelWithDebInfo', '-r', '--RelMinSize'])
+        # each child writes its own report into a temporary directory, they are collected into report of this build
+        import tempfile, shutil
+        report_dir = tempfile.mkdtemp(prefix='build_reports_') if self.report else None
+        def build_configuration(configuration):
+            build_type, build_tool, build_directory = configuration
+            command = [sys.executable, os.path.abspath(__file__)] + base_args + ['--no-log-file', '--build-type', build_type, \
+                '--build-tool', build_tool, '--build-directory', build_directory, '--jobs', str(jobs_per_configuration)]
+            if report_dir:
+                command.extend(['--report', self.report, '--report-file', os.path.join(report_dir, build_directory.replace('/', '_') + '.json')])
+            start_time = time.time()
+            return_code, _, _ = self.run_process(command, capture=False, env=child_env, \
+                log_prefix='[{0}/{1}] '.format(build_type, build_tool))
+            return return_code, time.time() - start_time
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(n_parallel)
+        try:
+            results = pool.map(build_configuration, self.matrix)
+            if report_dir:
+                self.matrix_reports = []
+                for build_type, build_tool, build_directory in self.matrix:
+                    try:
+                        with open(os.path.join(report_dir, build_directory.replace('/', '_') + '.json'), 'r') as f:
+                            self.matrix_reports.append(json.load(f))
+                    except (IOError, OSError, ValueError): # child failed before writing its report
+                        self.matrix_reports.append({'build_type': build_type, 'build_tool': build_tool, 'result': 'failed'})
+        finally:
+            pool.close()
+            pool.join()
+            if report_dir:
+                shutil.rmtree(report_dir, ignore_errors=True)
+        self.logger.info('##############################################################################################')
+        self.logger.info('# summery')
+        self.logger.info('##############################################################################################')
+        self.logger.info(' * {0:24} {1:32} {2:8} {3}'.format('configuration', 'build directory', 'result', 'time'))
+        n_failed = 0
+        for (build_type, build_tool, build_directory), (return_code, duration) in zip(self.matrix, results):
+            result = 'passed' if 0 == return_code else 'failed'
+            n_failed += 0 if 0 == return_code else 1
+            self.logger.info(' * {0:24} {1:32} {2:8} {3:.1f}s'.format(build_type + '/' + build_tool, build_directory, result, duration))
+        if n_failed > 0:
+            self.logger.error('[ERROR] {0} of {1} configurations failed'.format(n_failed, len(self.matrix)))
+            raise Exception('matrix build failed')
+        self.logger.info('done building at {0}'.format(self.get_time_stamp()))
+
+    ##############################################################################################
+    # build daemon
+    ##############################################################################################
+    def start_daemon(self):
+        '''
+        entry for build daemon, every build request is served by a forked child of this process,
+        children inherit imported modules && probed toolchain, builds of same build directory are serialized
+        '''
+        import socket
+        if 'Linux' != host_system():
+            raise Exception('build daemon is only supported on linux')
+        self.close_log_files() # children can not inherit log writer thread
+        self.check_build_environment()
+        self.begin_phase('daemon')
+        self.daemon_tool_versions = {'tool_versions': self.tool_versions, 'full_version_check_log': self.full_version_check_log}
+        if os.path.exists(self.daemon_socket):
+            os.remove(self.daemon_socket) # left by a daemon not stopped properly
+        if not os.path.exists(os.path.dirname(self.daemon_socket)):
+            os.makedirs(os.path.dirname(self.daemon_socket))
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.daemon_socket)
+        server.listen(16)
+        self.logger.info('build daemon serving at {0}, pid {1}'.format(self.daemon_socket, os.getpid()))
+        try:
+            while True:
+                connection, _ = server.accept()
+                connection.settimeout(DAEMON_REQUEST_TIMEOUT)
+                try:
+                    request = json.loads(connection.makefile('r').readline())
+                except (socket.timeout, IOError, OSError, ValueError) as err:
+                    self.logger.warning('build request not received : {0}'.format(err))
+                    connection.close()
+                    continue
+                connection.settimeout(None)
+                if 'stop' == request.get('command'):
+                    connection.close()
+                    break
+                self.logger.info('build request {0} in {1}'.format(request['args'], request['cwd']))
+                read_fd, write_fd = os.pipe()
+                pid = os.fork() # fork in main thread only, so child never inherits a lock held by another thread
+                if 0 == pid:
+                    os.close(read_fd)
+                    server.close()
+                    connection.close()
+                    self.serve_daemon_request(request, write_fd)
+                os.close(write_fd)
+                forwarder = threading.Thread(target=self.forward_daemon_output, args=(pid, read_fd, connection))
+                forwarder.daemon = True
+                forwarder.start()
+        finally:
+            server.close()
+            os.remove(self.daemon_socket)
+        self.logger.info('build daemon stopped')
+
+    def serve_daemon_request(self, request, output_fd):
+        '''
+        run in forked child, build as requested with stdout && stderr sent to output_fd, never returns
+        '''
+        return_code = 1
+        try:
+            os.dup2(output_fd, 1)
+            os.dup2(output_fd, 2)
+            os.chdir(request['cwd'])
+            os.environ.clear()
+            os.environ.update(request['env'])
+            # toolchain probed by daemon is still valid if PATH is same
+            builder = CMakeCPPBuilder(probed_toolchain = self.daemon_tool_versions if request['env'].get('PATH') == self.env.get('PATH') else None)
+            builder.daemon_child = True
+            builder.start(args = request['args'])
+            return_code = 0
+        except SystemExit as err:
+            return_code = err.code if isinstance(err.code, int) else 1
+        except BaseException:
+            import traceback
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(return_code)
+
+    def forward_daemon_output(self, pid, read_fd, connection):
+        '''
+        forward output of child pid to client connection, followed by its exit code
+        '''
+        import struct
+        status = None
+        try:
+            while True:
+                data = os.read(read_fd, 65536)
+                if not data:
+                    break
+                connection.sendall(DAEMON_FRAME_OUTPUT + struct.pack('>I', len(data)) + data)
+            _, status = os.waitpid(pid, 0)
+            return_code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else 1
+            connection.sendall(DAEMON_FRAME_EXIT + struct.pack('>I', return_code))
+        except (IOError, OSError) as err: # client went away
+            self.logger.warning('build request of child {0} not fully served : {1}'.format(pid, err))
+        finally:
+            os.close(read_fd) # child gets EPIPE on further output
+            connection.close()
+            if status is None: # reap child, or it stays a zombie
+                os.waitpid(pid, 0)
+
+    def lock_build_dir(self):
+        '''
+        take exclusive lock of build directory, held until this process exits
+        '''
+        import fcntl, hashlib
+        lock_dir = os.path.join(get_cache_dir(), 'locks')
+        if not os.path.exists(lock_dir):
+            os.makedirs(lock_dir)
+        lock_path = os.path.join(lock_dir, hashlib.sha1(os.path.abspath(self.build_dir).encode('utf-8')).hexdigest() + '.lock')
+        self.build_dir_lock = open(lock_path, 'w')
+        try:
+            fcntl.flock(self.build_dir_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError):
+            self.logger.info('waiting for another build in {0}'.format(self.build_dir))
+            fcntl.flock(self.build_dir_lock, fcntl.LOCK_EX)
+
     ##############################################################################################
     # docker build procedure
     ##############################################################################################
@@ -192,19 +739,92 @@ Visual Studio 2012 [specify 2012 or 11 as MSVC_VERSION]
         entry for build with docker
         '''
         self.log_build_configuration()
-        docker_command = ['docker', 'run', '--rm', '-t', \
-            '--mount', 'type=bind,source={0},target={1}'.format(self.source_dir, self.docker_mapped_path), \
-            self.docker_toolchain_image, \
-            'bash', '-c', 'cd "{0}" && python -m build {1}'.format(self.docker_mapped_path, self.docker_arguments) \
-        ]
+        if self.docker_persistent:
+            self.begin_phase('docker_container')
+            container_name = self.get_docker_container_name()
+            self.ensure_docker_container(container_name, self.docker_mount_options())
+            docker_command = ['docker', 'exec', '-t', container_name]
+        else:
+            docker_command = ['docker', 'run', '--rm', '-t'] + self.docker_mount_options()
+            docker_command.append(self.docker_toolchain_image)
+        docker_command.extend(['bash', '-c', 'cd "{0}" && python -m build {1}'.format(self.docker_mapped_path, self.docker_arguments)])
         self.logger.info('**********************************************************************************************')
         self.logger.info('* start building with docker image {0} at {1}'.format(self.docker_toolchain_image, self.get_time_stamp()))
         self.logger.info('**********************************************************************************************')
-        self.run_shell_command(docker_command)
+        self.begin_phase('docker_build')
+        self.run_build_step(docker_command, 'docker build')
         self.logger.info('**********************************************************************************************')
         self.logger.info('* done building with docker at {0}'.format(self.get_time_stamp()))
         self.logger.info('**********************************************************************************************')
     
+    def docker_mount_options(self):
+        '''
+        --mount options of toolchain container, named volumes are used for persistent container
+        '''
+        options = ['--mount', 'type=bind,source={0},target={1}'.format(self.source_dir, self.docker_mapped_path)]
+        if self.docker_persistent:
+            options.extend(['--mount', 'type=volume,source={0}_build,target={1}/{2}'.format( \
+                self.get_docker_container_name(), self.docker_mapped_path, self.docker_build_directory)])
+            if self.compiler_cache:
+                options.extend(['--mount', 'type=volume,source={0}_compiler_cache,target={1}'.format( \
+                    self.get_docker_container_name(), DOCKER_COMPILER_CACHE_PATH)])
+        elif self.compiler_cache:
+            if not os.path.exists(self.compiler_cache_dir):
+                os.makedirs(self.compiler_cache_dir)
+            options.extend(['--mount', 'type=bind,source={0},target={1}'.format(self.compiler_cache_dir, DOCKER_COMPILER_CACHE_PATH)])
+        return options
+
+    def ensure_docker_container(self, container_name, mount_options):
+        '''
+        make sure persistent toolchain container is running && healthy, create it if needed
+        '''
+        import hashlib
+        config = hashlib.sha1(repr([self.docker_toolchain_image] + mount_options).encode('utf-8')).hexdigest()
+        stdout, _ = self.run_shell_command(['docker', 'inspect', '-f', \
+            '{{{{.State.Running}}}} {{{{index .Config.Labels "{0}"}}}}'.format(DOCKER_CONTAINER_LABEL), container_name], log_info=False)
+        state = stdout.split()
+        if len(state) == 2 and state[1] != config:
+            self.logger.info('toolchain container {0} configuration changed, recreating'.format(container_name))
+            self.run_shell_command(['docker', 'rm', '-f', container_name], log_info=False)
+            state = []
+        elif len(state) == 2 and state[0] != 'true':
+            self.logger.info('starting toolchain container {0}'.format(container_name))
+            self.run_shell_command(['docker', 'start', container_name], log_info=False)
+        if len(state) == 2:
+            # health check, a container which can not exec is recreated
+            return_code, _, stderr = self.run_process(['docker', 'exec', container_name, 'true'], log_info=False)
+            if 0 != return_code:
+                self.logger.warning('toolchain container {0} not healthy, recreating : {1}'.format(container_name, stderr.strip()))
+                self.run_shell_command(['docker', 'rm', '-f', container_name], log_info=False)
+                state = []
+        if len(state) != 2:
+            self.logger.info('creating toolchain container {0} from {1}'.format(container_name, self.docker_toolchain_image))
+            return_code, _, _ = self.run_process(['docker', 'run', '-d', '--name', container_name, \
+                '--label', '{0}={1}'.format(DOCKER_CONTAINER_LABEL, config)] + mount_options + \
+                [self.docker_toolchain_image, 'tail', '-f', '/dev/null'])
+            if 0 != return_code:
+                self.logger.error('[ERROR] failed creating toolchain container {0}'.format(container_name))
+                raise Exception('failed creating toolchain container')
+
+    def prune_docker_container(self):
+        '''
+        remove persistent toolchain container && its named volumes
+        '''
+        container_name = self.get_docker_container_name()
+        self.logger.info('removing toolchain container {0} && its volumes'.format(container_name))
+        self.run_shell_command(['docker', 'rm', '-f', container_name, container_name + '_worker'])
+        self.run_shell_command(['docker', 'volume', 'rm', '-f', container_name + '_build', container_name + '_compiler_cache'])
+
+    def get_docker_container_name(self):
+        '''
+        name of persistent toolchain container, --docker-container-name or derived from source directory && toolchain image
+        '''
+        if not self.docker_container_name:
+            import hashlib
+            self.docker_container_name = 'cmake_cpp_builder_' + \
+                hashlib.sha1((self.source_dir + '|' + self.docker_toolchain_image).encode('utf-8')).hexdigest()[:12]
+        return self.docker_container_name
+
     ##############################################################################################
     # windows build procedure
     ##############################################################################################
@@ -212,6 +832,8 @@ Visual Studio 2012 [specify 2012 or 11 as MSVC_VERSION]
         '''
         entry for configuration build for windows, make changes if needed
         '''
+        import platform
+        self.begin_phase('build_configuration')
         self.msvc_community = True
         if 'Visual Studio' == self.build_tool:
             # determine architercture parameter for vcvarsall.bat script && cmake -G option, we do not support x86 host architecture
@@ -226,31 +848,44 @@ Visual Studio 2012 [specify 2012 or 11 as MSVC_VERSION]
             else:
                 self.logger.error('[ERROR] target_architecture {0} not supported'.format(self.target_architecture))
                 raise Exception('target architecture not supported')
+            self.vcvarsall_arch_param = vcvarsall_arch_param
             # build configurations
             if self.msvc_version == 2019 or self.msvc_version == 16:
                 self.cmake_gen_target = 'Visual Studio 16 2019'
-                self.make_command_gen = lambda solution_name : ['vcvarsall.bat', vcvarsall_arch_param, \
-                    '&&', 'MSBuild.exe', solution_name, '-p:Configuration='+self.build_type, '-p:Platform='+self.target_architecture]
+                self.make_command_gen = lambda solution_name, targets : ['MSBuild.exe', solution_name, \
+                    '-p:Configuration='+self.build_type, '-p:Platform='+self.target_architecture, '-m:{0}'.format(self.jobs)] + self.msbuild_target_option(targets)
             elif self.msvc_version == 2017 or self.msvc_version == 15:
                 self.cmake_gen_target = 'Visual Studio 15 2017 ' + cmake_gen_arch_postfix
-                self.make_command_gen = lambda solution_name : ['vcvarsall.bat', vcvarsall_arch_param, \
-                    '&&', 'MSBuild.exe', solution_name, '-p:Configuration='+self.build_type, '-p:Platform='+self.target_architecture]
+                self.make_command_gen = lambda solution_name, targets : ['MSBuild.exe', solution_name, \
+                    '-p:Configuration='+self.build_type, '-p:Platform='+self.target_architecture, '-m:{0}'.format(self.jobs)] + self.msbuild_target_option(targets)
             elif self.msvc_version == 2015 or self.msvc_version == 14:
                 self.cmake_gen_target = 'Visual Studio 14 2015 ' + cmake_gen_arch_postfix
-                self.make_command_gen = lambda solution_name : ['vcvarsall.bat', vcvarsall_arch_param, \
-                    '&&', 'MSBuild.exe', solution_name, '-p:Configuration='+self.build_type, '-p:Platform='+self.target_architecture]
+                self.make_command_gen = lambda solution_name, targets : ['MSBuild.exe', solution_name, \
+                    '-p:Configuration='+self.build_type, '-p:Platform='+self.target_architecture, '-m:{0}'.format(self.jobs)] + self.msbuild_target_option(targets)
             elif self.msvc_version == 2013 or self.msvc_version == 12:
                 self.cmake_gen_target = 'Visual Studio 12 2013 ' + cmake_gen_arch_postfix
-                self.make_command_gen = lambda solution_name : ['vcvarsall.bat', vcvarsall_arch_param, \
-                    '&&', 'MSBuild.exe', solution_name, '-p:Configuration='+self.build_type, '-p:Platform='+self.target_architecture]
+                self.make_command_gen = lambda solution_name, targets : ['MSBuild.exe', solution_name, \
+                    '-p:Configuration='+self.build_type, '-p:Platform='+self.target_architecture, '-m:{0}'.format(self.jobs)] + self.msbuild_target_option(targets)
             elif self.msvc_version == 2012 or self.msvc_version == 11:
                 self.cmake_gen_target = 'Visual Studio 11 2012 ' + cmake_gen_arch_postfix
-                self.make_command_gen = lambda solution_name : ['C:/Windows/Microsoft.NET/Framework/v4.0.30319/MSBuild.exe', \
-                    solution_name, '-p:Configuration='+self.build_type, '-p:Platform='+self.target_architecture]
+                self.make_command_gen = lambda solution_name, targets : ['C:/Windows/Microsoft.NET/Framework/v4.0.30319/MSBuild.exe', \
+                    solution_name, '-p:Configuration='+self.build_type, '-p:Platform='+self.target_architecture, '-m:{0}'.format(self.jobs)] + self.msbuild_target_option(targets)
             else:
                 self.logger.error('[ERROR] Visual Studio {0} not supported'.format(self.msvc_version))
                 raise Exception('Visual Studio {0} not supported'.format(self.msvc_version))
             self.cmake_command = ['cmake', '-G', self.cmake_gen_target, self.source_dir]
+            self.setup_compiler_cache()
+            if self.profile_build:
+                self.logger.warning('--profile-build is only supported on linux, ignored')
+                self.profile_build = False
+            if self.distributed_workers:
+                self.logger.warning('--distributed-workers is only supported on linux, ignored')
+                self.distributed_workers = []
+            if self.resource_scheduler:
+                self.logger.warning('--resource-scheduler is only supported on linux, ignored')
+                self.resource_scheduler = False
+            self.add_compiler_launcher_options()
+            self.add_unity_build_options()
         else:
             self.logger.error('[ERROR] unknown build tool {0}'.format(self.build_tool))
             raise Exception('build tool {0} not supported'.format(self.build_tool))
@@ -261,23 +896,18 @@ Visual Studio 2012 [specify 2012 or 11 as MSVC_VERSION]
         '''
         self.log_build_configuration()
         self.logger.info('start building windows target at {0}'.format(self.get_time_stamp()))
+        self.remove_build_stamp()
         if self.clean_before_build:
-            if os.path.exists(self.build_dir):
-                self.logger.info('removing ' + self.build_dir)
-                shutil.rmtree(self.build_dir)
+            self.begin_phase('clean')
+            self.clean_build_dir()
+        else:
+            self.start_trash_removal()
         if not os.path.exists(self.build_dir):
             os.makedirs(self.build_dir)
         os.chdir(self.build_dir)
-        if os.path.exists('CMakeCache.txt'):
-            self.logger.info('removing ' + self.build_dir + '/CMakeCache.txt')
-            os.remove('CMakeCache.txt')
+        self.write_generated_files()
         # run cmake
-        self.logger.info('##############################################################################################')
-        self.logger.info('# running cmake')
-        self.logger.info('##############################################################################################')
-        stdout, stderr = self.run_shell_command(self.cmake_command)
-        if len(stderr) > 1:
-            raise Exception('running cmake error')
+        stdout = self.run_cmake()
         # find c compiler from cmake log
         c_compiler_matchs = re.findall(r'Check for working C compiler: ([:/.()\w\s]+)\n', stdout)
         if len(c_compiler_matchs) == 0:
@@ -309,6 +939,9 @@ Visual Studio 2012 [specify 2012 or 11 as MSVC_VERSION]
             self.auxilary_tool_dir = dir + '/Auxiliary/Build'
             self.logger.info(' * Auxilary tool path : {0}'.format(self.auxilary_tool_dir))
             self.add_path_to_env(self.auxilary_tool_dir)
+            # run vcvarsall.bat once, every build command reuses its environment
+            self.begin_phase('vcvarsall')
+            self.capture_vcvarsall_env()
         # guess solution name
         solution_name = None
         # 1 walk through build dir, find only .sln file
@@ -335,38 +968,62 @@ Visual Studio 2012 [specify 2012 or 11 as MSVC_VERSION]
         if not solution_name:
             self.logger.error('[ERROR] solution name not found');
             raise Exception('solution name not found')
-        # determine targets
-        self.solution_names = []
-        if 0 == len(self.targets):
-            self.solution_names.append(solution_name)
-        else:
-            targets = [t.lower() for t in self.targets]
-            if 'all' in targets:
-                self.solution_names.append(solution_name)
-                targets.remove('all')
-            for target in targets:
-                if os.path.exists(target + '.vcxproj'): # prefer cpp more
-                    self.solution_names.append(target + '.vcxproj')
-                    self.logger.info('Solution located {0}'.format(self.solution_names[-1]))
-                elif os.path.exists(target + '.vcproj'):
-                    self.solution_names.append(target + '.vcproj')
-                    self.logger.info('Solution located {0}'.format(self.solution_names[-1]))
-                else:
-                    self.logger.error('[ERROR] target {0} not found in build dir {1}'.format(target, self.build_dir))
-                    raise Exception('target {0} not found'.format(target))
+        # determine targets, all of them are built by one MSBuild invocation of the solution,
+        # so independent projects are built in parallel && project dependencies are respected
+        self.solution_name = solution_name
+        self.solution_targets = []
+        for target in [t.lower() for t in self.targets]:
+            if 'all' == target:
+                self.solution_targets.append('Build')
+            elif os.path.exists(target + '.vcxproj') or os.path.exists(target + '.vcproj'):
+                self.solution_targets.append(target)
+                self.logger.info('Project located {0}'.format(target))
+            else:
+                self.logger.error('[ERROR] target {0} not found in build dir {1}'.format(target, self.build_dir))
+                raise Exception('target {0} not found'.format(target))
         # run make command
-        for solution_name in self.solution_names:
-            self.logger.info('##############################################################################################')
-            self.logger.info('# building target {0}'.format(solution_name))
-            self.logger.info('##############################################################################################')
-            _, stderr = self.run_shell_command( self.make_command_gen( solution_name = solution_name ) )
-            if len(stderr) > 1:
-                raise Exception('build error')
+        self.begin_phase('compile')
+        self.record_compiler_cache_stats()
+        self.logger.info('##############################################################################################')
+        self.logger.info('# building targets {0} of {1}'.format(self.solution_targets if self.solution_targets else ['Build'], self.solution_name))
+        self.logger.info('##############################################################################################')
+        self.full_compile = not self.has_object_files()
+        compile_start = monotonic()
+        self.run_build_step(self.make_command_gen( solution_name = self.solution_name, targets = self.solution_targets ), 'build')
+        self.compile_seconds = monotonic() - compile_start
         self.logger.info('##############################################################################################')
         self.logger.info('# summery')
         self.logger.info('##############################################################################################')
+        self.report_compiler_cache_stats()
+        self.report_diagnostics()
+        self.report_compile_times()
+        self.write_build_stamp()
         self.logger.info('done building at {0}'.format(self.get_time_stamp()))
         
+    def msbuild_target_option(self, targets):
+        '''
+        MSBuild -t option building targets of solution, project names in solution targets use '_' for '.'
+        '''
+        if not targets:
+            return []
+        return ['-t:' + ';'.join(t.replace('.', '_') for t in targets)]
+
+    def capture_vcvarsall_env(self):
+        '''
+        run vcvarsall.bat once && replace self.env with environment it sets up
+        '''
+        stdout, stderr = self.run_shell_command(['vcvarsall.bat', self.vcvarsall_arch_param, '>', 'nul', '&&', 'set'], log_info=False)
+        env = {}
+        for line in stdout.splitlines():
+            key, sep, value = line.partition('=')
+            if sep and key:
+                env[key.upper()] = value # windows environment variable names are case insensitive
+        if 'PATH' not in env:
+            self.logger.error('[ERROR] failed capturing environment of vcvarsall.bat {0} : {1}'.format(self.vcvarsall_arch_param, stderr))
+            raise Exception('failed capturing vcvarsall.bat environment')
+        self.logger.info(' * vcvarsall.bat {0} environment captured'.format(self.vcvarsall_arch_param))
+        self.env = env
+
     ##############################################################################################
     # linux build procedure
     ##############################################################################################
@@ -374,54 +1031,1104 @@ Visual Studio 2012 [specify 2012 or 11 as MSVC_VERSION]
         '''
         entry for configuration build for linux, make changes if needed
         '''
+        self.begin_phase('build_configuration')
         if 'ninja' == self.build_tool:
             self.cmake_gen_target = 'Ninja'
             self.cmake_command = ['cmake', '-G', self.cmake_gen_target, '-DCMAKE_BUILD_TYPE='+self.build_type, self.source_dir]
-            self.make_command = ['ninja']
+            self.make_command = ['ninja', '-j', str(self.jobs)]
         elif 'make' == self.build_tool:
             self.cmake_gen_target = 'Unix Makefiles'
             self.cmake_command = ['cmake', '-G', self.cmake_gen_target, '-DCMAKE_BUILD_TYPE='+self.build_type, self.source_dir]
-            self.make_command = ['make']
+            self.make_command = ['make', '-j', str(self.jobs)]
         else:
             self.logger.error('[ERROR] unknown build tool {0}'.format(self.build_tool))
             raise Exception('build tool {0} not supported'.format(self.build_tool))
+        self.setup_compiler_cache()
+        self.setup_distributed_build()
+        self.setup_resource_scheduler()
+        self.add_compiler_launcher_options()
+        self.add_unity_build_options()
         
     def start_build_lin(self):
         '''
         entry for build program
         '''
+        from copy import copy
         self.log_build_configuration()
         self.logger.info('start building linux target at {0}'.format(self.get_time_stamp()))
+        self.remove_build_stamp()
         if self.clean_before_build:
-            if os.path.exists(self.build_dir):
-                shutil.rmtree(self.build_dir)
+            self.begin_phase('clean')
+            self.clean_build_dir()
+        else:
+            self.start_trash_removal()
         if not os.path.exists(self.build_dir):
             os.makedirs(self.build_dir)
         os.chdir(self.build_dir)
-        if os.path.exists('CMakeCache.txt'):
-            os.remove('CMakeCache.txt')
+        self.write_generated_files()
         # run cmake
-        self.logger.info('##############################################################################################')
-        self.logger.info('# running cmake')
-        self.logger.info('##############################################################################################')
-        _, stderr = self.run_shell_command(self.cmake_command)
-        if len(stderr) > 1:
-            raise Exception('running cmake error')
+        self.run_cmake()
         # build targets
+        self.begin_phase('compile')
+        self.record_compiler_cache_stats()
+        if self.profile_build and os.path.exists(self.build_profile_log):
+            os.remove(self.build_profile_log)
+        if self.distributed_config and os.path.exists(DISTRIBUTED_STATS_FILE):
+            os.remove(DISTRIBUTED_STATS_FILE)
+        if self.scheduler_config and os.path.exists(SCHEDULER_STATS_FILE):
+            os.remove(SCHEDULER_STATS_FILE)
         self.logger.info('##############################################################################################')
         self.logger.info('# builiding targets {0}'.format(self.targets))
         self.logger.info('##############################################################################################')
         make_command = copy(self.make_command)
         make_command.extend(self.targets)
-        _, stderr = self.run_shell_command(make_command)
-        if len(stderr) > 1:
-            raise Exception('build error')
+        self.full_compile = not self.has_object_files()
+        compile_start = monotonic()
+        self.run_build_step(make_command, 'build')
+        self.compile_seconds = monotonic() - compile_start
         # summery
         self.logger.info('##############################################################################################')
         self.logger.info('# summery')
         self.logger.info('##############################################################################################')
+        self.report_compiler_cache_stats()
+        self.report_distributed_build_stats()
+        self.report_resource_scheduler_stats()
+        self.report_diagnostics()
+        self.report_compile_times()
+        if self.profile_build:
+            self.report_build_profile()
+        self.write_build_stamp()
         self.logger.info('done building at {0}'.format(self.get_time_stamp()))
         
+    ##############################################################################################
+    # cmake configure
+    ##############################################################################################
+    def run_cmake(self):
+        '''
+        run cmake_command in build dir, return log of the last full configure
+
+        cmake is skipped if configure fingerprint matches the last successful configure,
+        CMakeCache.txt is kept if only CMakeLists files changed
+        '''
+        self.begin_phase('cmake_configure')
+        self.logger.info('##############################################################################################')
+        self.logger.info('# running cmake')
+        self.logger.info('##############################################################################################')
+        cache_fingerprint, lists_fingerprint = self.compute_configure_fingerprint()
+        fingerprint = cache_fingerprint + ' ' + lists_fingerprint
+        last_fingerprint = self.read_text_file(CONFIGURE_FINGERPRINT_FILE)
+        last_configure_log = self.read_text_file(CONFIGURE_LOG_FILE)
+        has_cache = os.path.exists('CMakeCache.txt')
+        if self.reconfigure or not last_fingerprint or not last_configure_log:
+            keep_cache = False
+        else:
+            keep_cache = has_cache and last_fingerprint.split()[0] == cache_fingerprint
+        if keep_cache and fingerprint == last_fingerprint:
+            self.logger.info('configure fingerprint not changed, skip running cmake')
+            return last_configure_log
+        if os.path.exists(CONFIGURE_FINGERPRINT_FILE):
+            os.remove(CONFIGURE_FINGERPRINT_FILE)
+        if has_cache and not keep_cache:
+            self.logger.info('removing ' + self.build_dir + '/CMakeCache.txt')
+            os.remove('CMakeCache.txt')
+        stdout = self.run_build_step(self.cmake_command, 'running cmake', capture=True)
+        if keep_cache:
+            # compilers are only reported by a full configure, keep log of that one
+            stdout = last_configure_log
+        else:
+            self.write_text_file(CONFIGURE_LOG_FILE, stdout)
+        self.write_text_file(CONFIGURE_FINGERPRINT_FILE, fingerprint)
+        return stdout
+
+    def compute_configure_fingerprint(self):
+        '''
+        return (cache_fingerprint, lists_fingerprint)
+
+        cache_fingerprint covers cmake command (generator, build type), toolchain versions && environment,
+        lists_fingerprint covers CMakeLists.txt && *.cmake files in source directory
+        '''
+        import hashlib
+        cache_hash = hashlib.sha1()
+        cache_hash.update(repr(self.cmake_command).encode('utf-8'))
+        tool_versions = getattr(self, 'tool_versions', {})
+        for tool_name in sorted(tool_versions.keys()):
+            cache_hash.update('{0}={1}\n'.format(tool_name, tool_versions[tool_name]).encode('utf-8'))
+        for key in sorted(self.env.keys()):
+            if key in CONFIGURE_ENV_KEYS or any(key.startswith(p) for p in CONFIGURE_ENV_PREFIXES):
+                cache_hash.update('{0}={1}\n'.format(key, self.env[key]).encode('utf-8'))
+        lists_hash = hashlib.sha1()
+        for path in self.find_cmake_list_files():
+            lists_hash.update(path.encode('utf-8') + b'\n')
+            with open(path, 'rb') as f:
+                lists_hash.update(f.read())
+        return cache_hash.hexdigest(), lists_hash.hexdigest()
+
+    def find_cmake_list_files(self):
+        '''
+        find CMakeLists.txt && *.cmake in source directory, build trees && hidden directories are skipped
+        '''
+        build_dir = os.path.normcase(os.path.abspath(self.build_dir))
+        found = []
+        for r, dirs, files in os.walk(self.source_dir):
+            if os.path.normcase(os.path.abspath(r)) == build_dir or ('CMakeCache.txt' in files and r != self.source_dir):
+                dirs[:] = []
+                continue
+            dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+            for file in sorted(files):
+                if file == 'CMakeLists.txt' or file.endswith('.cmake'):
+                    found.append(os.path.join(r, file).replace(os.path.sep, '/'))
+        return found
+
+    ##############################################################################################
+    # up to date check
+    ##############################################################################################
+    def check_build_up_to_date(self):
+        '''
+        scan source tree && return True if last build in build directory is up to date, so the whole build can be skipped
+
+        last build is up to date if its stamp has same build commands, toolchain && source tree,
+        && all files installed by it (install target) still exist
+        '''
+        self.begin_phase('up_to_date_check')
+        stamp = None
+        try:
+            with open(os.path.join(self.build_dir, BUILD_STAMP_FILE), 'r') as f:
+                stamp = json.load(f)
+        except (IOError, OSError, ValueError):
+            pass
+        self.build_stamp = {
+            'version': 1,
+            'commands': self.resolved_build_commands(),
+            'tools': self.get_tool_stamps(),
+            'files': self.scan_source_tree(stamp.get('files', {}) if stamp else {}),
+        }
+        if self.clean_before_build or self.reconfigure or self.always_build or not stamp:
+            return False
+        for key in ['version', 'commands', 'tools']:
+            if stamp.get(key) != self.build_stamp[key]:
+                self.logger.debug(' * {0} changed since last build'.format(key))
+                return False
+        content = lambda files : dict((path, files[path][2]) for path in files) # a touched file is not a change
+        if content(stamp.get('files', {})) != content(self.build_stamp['files']):
+            self.logger.debug(' * files changed since last build')
+            return False
+        if 'install' in self.targets:
+            manifest = self.read_text_file(os.path.join(self.build_dir, 'install_manifest.txt'))
+            if manifest is None or not all(os.path.exists(path) for path in manifest.splitlines() if path):
+                self.logger.debug(' * installed files missing')
+                return False
+        self.logger.info('##############################################################################################')
+        self.logger.info('# nothing changed since last build, build skipped')
+        self.logger.info('##############################################################################################')
+        return True
+
+    def remove_build_stamp(self):
+        '''
+        remove stamp of last build before this one starts, so a failed build is never taken as up to date
+        '''
+        stamp_path = os.path.join(self.build_dir, BUILD_STAMP_FILE)
+        if os.path.exists(stamp_path):
+            os.remove(stamp_path)
+
+    def write_build_stamp(self):
+        if not getattr(self, 'build_stamp', None):
+            return
+        with open(os.path.join(self.build_dir, BUILD_STAMP_FILE), 'w') as f:
+            json.dump(self.build_stamp, f, sort_keys=True)
+
+    def resolved_build_commands(self):
+        env = dict((key, self.env[key]) for key in self.env \
+            if key in CONFIGURE_ENV_KEYS or any(key.startswith(p) for p in CONFIGURE_ENV_PREFIXES))
+        if 'Windows' == host_system():
+            make_command = self.make_command_gen(solution_name = '', targets = self.targets)
+        else:
+            make_command = self.make_command + self.targets
+        return {'cmake': self.cmake_command, 'make': make_command, 'env': env}
+
+    def get_tool_stamps(self):
+        '''
+        resolved path, mtime && size of every tool, tells toolchain changes without running any tool
+        '''
+        stamps = {}
+        for tool_name, command in TOOLS_TO_CHECK:
+            path = self.find_executable(command)
+            if path:
+                stat = os.stat(path)
+                stamps[tool_name] = [path, stat.st_mtime, stat.st_size]
+        return stamps
+
+    def scan_source_tree(self, last_files):
+        '''
+        return {relative path : [mtime, size, sha1]} of files in source tree
+
+        content of a file is only hashed if its mtime or size differs from last_files,
+        .gitignore files are honoured, .git, build trees && files written by this builder are skipped
+        '''
+        import hashlib
+        build_dir = os.path.normcase(os.path.abspath(self.build_dir))
+        skipped = set([os.path.normcase(os.path.abspath(self.report_file))])
+        if self.test:
+            skipped.add(os.path.normcase(os.path.abspath(self.test_junit)))
+        if self.package:
+            skipped.update(os.path.normcase(os.path.abspath(path)) for path in [self.package, self.package + PACKAGE_MANIFEST_SUFFIX])
+        manifest = self.read_text_file(os.path.join(self.build_dir, 'install_manifest.txt'))
+        if manifest:
+            skipped.update(os.path.normcase(os.path.abspath(path)) for path in manifest.splitlines() if path)
+        files = {}
+        pending = [(self.source_dir, '', [])]
+        while pending:
+            dir, rel_dir, ignore_rules = pending.pop()
+            gitignore = self.read_text_file(os.path.join(dir, '.gitignore'))
+            if gitignore:
+                ignore_rules = ignore_rules + self.parse_gitignore(gitignore, rel_dir)
+            for entry in scandir(dir):
+                rel_path = rel_dir + entry.name
+                is_dir = entry.is_dir()
+                if entry.name in ('.git', BUILD_TRASH_DIR) or self.is_git_ignored(rel_path, is_dir, ignore_rules):
+                    continue
+                if is_dir:
+                    if os.path.normcase(os.path.abspath(entry.path)) != build_dir \
+                            and not os.path.exists(os.path.join(entry.path, 'CMakeCache.txt')):
+                        pending.append((entry.path, rel_path + '/', ignore_rules))
+                    continue
+                if ('' == rel_dir and LOG_FILE_PATTERN.match(entry.name)) or os.path.normcase(os.path.abspath(entry.path)) in skipped:
+                    continue
+                stat = entry.stat()
+                last = last_files.get(rel_path)
+                if last and last[0] == stat.st_mtime and last[1] == stat.st_size:
+                    files[rel_path] = last
+                else:
+                    with open(entry.path, 'rb') as f:
+                        files[rel_path] = [stat.st_mtime, stat.st_size, hashlib.sha1(f.read()).hexdigest()]
+        return files
+
+    def parse_gitignore(self, content, rel_dir):
+        '''
+        return rules of .gitignore in rel_dir, each is (rel_dir, compiled pattern, negate, dir_only, anchored)
+        '''
+        rules = []
+        for line in content.splitlines():
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            negate = line.startswith('!')
+            pattern = line[1:] if negate else line
+            dir_only = pattern.endswith('/')
+            pattern = pattern.rstrip('/')
+            anchored = '/' in pattern
+            rules.append((rel_dir, compile_gitignore_pattern(pattern.lstrip('/')), negate, dir_only, anchored))
+        return rules
+
+    def is_git_ignored(self, rel_path, is_dir, ignore_rules):
+        ignored = False
+        for rel_dir, pattern, negate, dir_only, anchored in ignore_rules: # last matching rule wins
+            if dir_only and not is_dir:
+                continue
+            sub_path = rel_path[len(rel_dir):]
+            if pattern.match(sub_path if anchored else sub_path.rsplit('/', 1)[-1]):
+                ignored = not negate
+        return ignored
+
+    ##############################################################################################
+    # artifact cache
+    ##############################################################################################
+    def get_artifact_key(self):
+        '''
+        key of installed artifacts, from source content, toolchain versions, configure environment, build type && generator,
+        absolute paths are left out so that the key is same on every agent
+        '''
+        import platform, hashlib
+        files = self.build_stamp['files']
+        # pch options hold absolute paths, pch header is keyed by its path relative to source directory instead
+        cmake_options = [o for o in self.cmake_command[1:-1] if '_LAUNCHER=' not in o \
+            and not o.startswith('-DCMAKE_PROJECT_INCLUDE=') and not o.startswith('-DCMAKE_CPP_BUILDER_PCH=')]
+        # compiler && flags chosen by environment, e.g. CC=clang or CXXFLAGS=-O0, build different artifacts
+        env = dict((key, self.env[key]) for key in self.env if key not in ARTIFACT_KEY_IGNORED_ENV_KEYS \
+            and (key in CONFIGURE_ENV_KEYS or any(key.startswith(p) for p in CONFIGURE_ENV_PREFIXES)))
+        key_source = json.dumps({
+            'files': sorted((path, files[path][2]) for path in files),
+            'tools': self.tool_versions,
+            'env': env,
+            'platform': [host_system(), platform.machine()],
+            'build_type': self.build_type,
+            'generator': self.cmake_gen_target,
+            'cmake_options': cmake_options,
+            'pch': os.path.relpath(self.pch, self.source_dir).replace(os.path.sep, '/') if self.pch else None,
+            'targets': self.targets,
+        }, sort_keys=True)
+        return hashlib.sha1(key_source.encode('utf-8')).hexdigest()
+
+    def restore_artifacts(self):
+        '''
+        restore installed files from artifact caches, return True if restored && build can be skipped,
+        never restored if a real build is required by --rebuild, --always-build or --reconfigure
+        '''
+        if not self.artifact_caches or 'install' not in self.targets:
+            return False
+        if self.clean_before_build or self.always_build or self.reconfigure:
+            return False
+        self.begin_phase('artifact_restore')
+        self.artifact_key = self.get_artifact_key()
+        if not os.path.exists(self.build_dir):
+            os.makedirs(self.build_dir)
+        archive_path = os.path.join(self.build_dir, 'artifacts.tar.gz')
+        for i, cache in enumerate(self.artifact_caches):
+            if not cache.fetch(self.artifact_key, archive_path):
+                continue
+            import tarfile
+            with tarfile.open(archive_path, 'r:gz') as archive:
+                # archives may come from a shared store, only plain files && directories inside source directory are extracted
+                members = archive.getmembers()
+                if any(not (member.isfile() or member.isdir()) or os.path.isabs(member.name) or '..' in member.name.split('/') \
+                        for member in members):
+                    raise Exception('artifact {0} contains unsafe path or link'.format(self.artifact_key))
+                names = [member.name for member in members]
+                if hasattr(tarfile, 'data_filter'):
+                    archive.extractall(self.source_dir, members=members, filter='data')
+                else:
+                    archive.extractall(self.source_dir, members=members)
+            for previous_cache in self.artifact_caches[:i]: # fill faster caches looked up before
+                previous_cache.store(self.artifact_key, archive_path)
+            os.remove(archive_path)
+            installed = [self.source_dir + '/' + name for name in names if os.path.isfile(os.path.join(self.source_dir, name))]
+            self.write_text_file(os.path.join(self.build_dir, 'install_manifest.txt'), '\n'.join(installed))
+            self.write_build_stamp()
+            self.logger.info('##############################################################################################')
+            self.logger.info('# artifacts {0} restored from {1}, build skipped'.format(self.artifact_key, cache))
+            self.logger.info('##############################################################################################')
+            for path in installed:
+                self.logger.info(' * {0}'.format(path))
+            return True
+        self.logger.info('artifacts {0} not found in artifact caches'.format(self.artifact_key))
+        return False
+
+    def store_artifacts(self):
+        '''
+        store files installed by this build into artifact caches
+        '''
+        if not self.artifact_caches or 'install' not in self.targets:
+            return
+        self.begin_phase('artifact_store')
+        manifest = self.read_text_file(os.path.join(self.build_dir, 'install_manifest.txt'))
+        installed = [path for path in (manifest or '').splitlines() if path]
+        source_dir = os.path.normcase(os.path.abspath(self.source_dir))
+        if not installed or not all(os.path.normcase(os.path.abspath(path)).startswith(source_dir + os.path.sep) for path in installed):
+            self.logger.warning('installed files not found or not in source directory, artifacts not cached')
+            return
+        import tarfile
+        archive_path = os.path.join(self.build_dir, 'artifacts.tar.gz')
+        with tarfile.open(archive_path, 'w:gz') as archive:
+            for path in installed:
+                archive.add(path, arcname=os.path.relpath(path, self.source_dir).replace(os.path.sep, '/'))
+        for cache in self.artifact_caches:
+            cache.store(self.artifact_key, archive_path)
+        os.remove(archive_path)
+        self.logger.info(' * artifacts {0} stored'.format(self.artifact_key))
+
+    ##############################################################################################
+    # test && package stages
+    ##############################################################################################
+    def run_post_build_stages(self):
+        '''
+        run --test && --package stages, also when build is skipped or restored from artifact cache
+        '''
+        if self.test:
+            self.begin_phase('test')
+            self.run_tests()
+        if self.package:
+            self.begin_phase('package')
+            self.create_package()
+
+    def installed_files(self):
+        manifest = self.read_text_file(os.path.join(self.build_dir, 'install_manifest.txt'))
+        return [path for path in (manifest or '').splitlines() if path and os.path.isfile(path)]
+
+    def run_tests(self):
+        '''
+        run tests registered by add_test with ctest, else discovered test executables, write junit report
+        '''
+        self.logger.info('##############################################################################################')
+        self.logger.info('# running tests')
+        self.logger.info('##############################################################################################')
+        if not os.path.exists(os.path.dirname(self.test_junit)):
+            os.makedirs(os.path.dirname(self.test_junit))
+        if not self.test_patterns and os.path.exists(os.path.join(self.build_dir, 'CTestTestfile.cmake')):
+            self.run_ctest()
+        else:
+            self.run_test_executables()
+
+    def run_ctest(self):
+        os.chdir(self.build_dir)
+        command = ['ctest', '--output-on-failure', '-j', str(self.jobs), '--timeout', str(self.test_timeout), '-C', self.build_type]
+        if self.get_cmake_version() >= (3, 21):
+            command.extend(['--output-junit', os.path.abspath(self.test_junit)])
+        else:
+            self.logger.warning('junit report of ctest needs cmake 3.21, {0} not written'.format(self.test_junit))
+        return_code, _, _ = self.run_process(command, capture=False)
+        if 0 != return_code:
+            self.logger.error('[ERROR] ctest failed with exit code {0}'.format(return_code))
+            raise Exception('tests failed')
+
+    def run_test_executables(self):
+        '''
+        run test executables in parallel, each one in its own directory && process group, killed on timeout
+        '''
+        tests = self.discover_tests()
+        if not tests:
+            self.logger.error('[ERROR] no test executables found')
+            raise Exception('no test executables found')
+        self.logger.info(' * {0} tests, {1} in parallel, timeout {2}s'.format(len(tests), min(self.jobs, len(tests)), self.test_timeout))
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(min(self.jobs, len(tests)))
+        try:
+            results = sorted(pool.imap_unordered(self.run_test, tests), key = lambda result : result['name'])
+        finally:
+            pool.close()
+            pool.join()
+        self.write_junit_report(results)
+        n_failed = len([result for result in results if 'passed' != result['result']])
+        self.logger.info(' * {0:48} {1:8} {2}'.format('test', 'result', 'time'))
+        for result in results:
+            self.logger.info(' * {0:48} {1:8} {2:.2f}s'.format(result['name'], result['result'], result['seconds']))
+        self.logger.info(' * junit report written to {0}'.format(self.test_junit))
+        if n_failed > 0:
+            self.logger.error('[ERROR] {0} of {1} tests failed'.format(n_failed, len(results)))
+            raise Exception('tests failed')
+
+    def discover_tests(self):
+        '''
+        test executables matching --test-pattern, or executables installed by install target
+        '''
+        import glob
+        if self.test_patterns:
+            candidates = [path for pattern in self.test_patterns for path in glob.glob(os.path.join(self.source_dir, pattern))]
+        else:
+            candidates = self.installed_files()
+        tests = []
+        for path in sorted(set(os.path.abspath(path) for path in candidates)):
+            name = os.path.basename(path).lower()
+            if 'Windows' == host_system():
+                if name.endswith('.exe'):
+                    tests.append(path)
+            elif os.path.isfile(path) and os.access(path, os.X_OK) and not (name.endswith('.so') or '.so.' in name):
+                tests.append(path)
+        return tests
+
+    def run_test(self, path):
+        '''
+        run one test executable in its directory, return its result, output && time
+        '''
+        import subprocess
+        name = os.path.relpath(path, self.source_dir).replace(os.path.sep, '/')
+        if 'Windows' == host_system():
+            process_group_options = {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+        else:
+            process_group_options = {'preexec_fn': os.setsid}
+        start = monotonic()
+        try:
+            process = subprocess.Popen([path], cwd = os.path.dirname(path), env = self.env, \
+                stdout = subprocess.PIPE, stderr = subprocess.STDOUT, **process_group_options)
+        except (IOError, OSError) as err:
+            self.logger.error('[ERROR] failed starting test {0} : {1}'.format(name, err))
+            return {'name': name, 'result': 'error', 'seconds': 0.0, 'output': '{0}'.format(err)}
+        timed_out = []
+        timers = []
+        def start_timer(seconds, function, *args):
+            timer = threading.Timer(seconds, function, args = args)
+            timer.daemon = True
+            timers.append(timer)
+            timer.start()
+        def kill_on_timeout():
+            timed_out.append(True)
+            self.kill_process_tree(process, True)
+            # a test ignoring SIGTERM, or a descendant keeping output pipe open, would block communicate forever
+            start_timer(TEST_KILL_GRACE_SECONDS, self.kill_process_tree, process, True, True)
+        start_timer(self.test_timeout, kill_on_timeout)
+        try:
+            output, _ = process.communicate()
+        finally:
+            for timer in list(timers):
+                timer.cancel()
+        output = decode_output(output)
+        seconds = monotonic() - start
+        result = 'timeout' if timed_out else 'passed' if 0 == process.returncode else 'failed'
+        output_tail = output.splitlines()[-OUTPUT_TAIL_LINES:]
+        if 'passed' == result:
+            self.logger.info('[{0}] passed in {1:.2f}s'.format(name, seconds))
+        else:
+            self.logger.error('[ERROR] [{0}] {1} with exit code {2} in {3:.2f}s'.format(name, result, process.returncode, seconds))
+            for line in output_tail:
+                self.logger.error('[{0}] {1}'.format(name, line))
+        return {'name': name, 'result': result, 'seconds': seconds, 'output': '\n'.join(output_tail)}
+
+    def write_junit_report(self, results):
+        from xml.etree import ElementTree
+        invalid_characters = re.compile(u'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+        suite_name = os.path.basename(self.source_dir)
+        root = ElementTree.Element('testsuites')
+        suite = ElementTree.SubElement(root, 'testsuite', name = suite_name, tests = str(len(results)), \
+            failures = str(len([result for result in results if result['result'] in ('failed', 'timeout')])), \
+            errors = str(len([result for result in results if 'error' == result['result']])), \
+            time = '{0:.3f}'.format(sum(result['seconds'] for result in results)), timestamp = time.strftime('%Y-%m-%dT%H:%M:%S'))
+        for result in results:
+            case = ElementTree.SubElement(suite, 'testcase', name = result['name'], classname = suite_name, time = '{0:.3f}'.format(result['seconds']))
+            output = invalid_characters.sub('', result['output'])
+            if 'passed' != result['result']:
+                failure = ElementTree.SubElement(case, 'error' if 'error' == result['result'] else 'failure', message = result['result'])
+                failure.text = output
+            ElementTree.SubElement(case, 'system-out').text = output
+        ElementTree.ElementTree(root).write(self.test_junit, encoding = 'utf-8', xml_declaration = True)
+
+    def create_package(self):
+        '''
+        pack installed files (or --package-directory) into a tar archive compressed by ParallelGzipWriter,
+        archive is kept if it exists && packed files are not changed since it was written
+        '''
+        self.logger.info('##############################################################################################')
+        self.logger.info('# packaging {0}'.format(self.package))
+        self.logger.info('##############################################################################################')
+        if self.package_directory:
+            files = []
+            for r, dirs, names in os.walk(self.package_directory):
+                dirs.sort()
+                files.extend(os.path.join(r, name) for name in sorted(names))
+        else:
+            files = self.installed_files()
+        source_dir = os.path.normcase(os.path.abspath(self.source_dir))
+        package_path = os.path.normcase(os.path.abspath(self.package))
+        files = [path for path in files if os.path.normcase(os.path.abspath(path)) != package_path]
+        if not files:
+            self.logger.error('[ERROR] nothing to package, run install target or give --package-directory')
+            raise Exception('nothing to package')
+        if not all(os.path.normcase(os.path.abspath(path)).startswith(source_dir + os.path.sep) for path in files):
+            self.logger.error('[ERROR] packaged files should be in source directory {0}'.format(self.source_dir))
+            raise Exception('packaged files not in source directory')
+        manifest = {}
+        for path in files:
+            stat = os.stat(path)
+            manifest[os.path.relpath(path, self.source_dir).replace(os.path.sep, '/')] = [stat.st_size, stat.st_mtime]
+        manifest_path = self.package + PACKAGE_MANIFEST_SUFFIX
+        try:
+            with open(manifest_path, 'r') as f:
+                last_manifest = json.load(f)
+        except (IOError, OSError, ValueError):
+            last_manifest = None
+        if os.path.exists(self.package) and last_manifest == manifest:
+            self.logger.info(' * {0} files not changed, {1} kept'.format(len(manifest), self.package))
+            return
+        import tarfile
+        start = monotonic()
+        if not os.path.exists(os.path.dirname(self.package)):
+            os.makedirs(os.path.dirname(self.package))
+        temp_path = '{0}.{1}.tmp'.format(self.package, os.getpid())
+        try:
+            with open(temp_path, 'wb') as f:
+                writer = ParallelGzipWriter(f, self.jobs)
+                try:
+                    with tarfile.open(fileobj = writer, mode = 'w|') as archive:
+                        for arcname in sorted(manifest.keys()):
+                            archive.add(os.path.join(self.source_dir, arcname), arcname = arcname)
+                finally:
+                    writer.close()
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        if os.path.exists(self.package) and 'Windows' == host_system():
+            os.remove(self.package) # rename does not overwrite on windows
+        os.rename(temp_path, self.package)
+        self.write_text_file(manifest_path, json.dumps(manifest, indent=4, sort_keys=True))
+        self.logger.info(' * {0} files packed into {1}, {2}KB in {3:.2f}s'.format(len(manifest), self.package, \
+            os.path.getsize(self.package) // 1024, monotonic() - start))
+
+    ##############################################################################################
+    # compiler cache
+    ##############################################################################################
+    def setup_compiler_cache(self):
+        '''
+        detect ccache/sccache to be used as compiler launcher, pointed at compiler_cache_dir
+        '''
+        self.compiler_cache_launcher = None
+        if not self.compiler_cache:
+            return
+        if 'auto' != self.compiler_cache:
+            candidates = [self.compiler_cache]
+        elif 'Windows' == host_system():
+            candidates = COMPILER_CACHE_LAUNCHERS_WIN
+        else:
+            candidates = COMPILER_CACHE_LAUNCHERS_LIN
+        for candidate in candidates:
+            launcher = self.find_executable(candidate)
+            if launcher:
+                self.compiler_cache_launcher = launcher.replace(os.path.sep, '/')
+                break
+        if not self.compiler_cache_launcher:
+            if 'auto' != self.compiler_cache:
+                self.logger.error('[ERROR] compiler cache {0} not found'.format(self.compiler_cache))
+                raise Exception('compiler cache {0} not found'.format(self.compiler_cache))
+            self.logger.warning('no compiler cache found in {0}, build without compiler cache'.format(candidates))
+            return
+        if self.cmake_gen_target.startswith('Visual Studio'):
+            self.logger.warning('compiler launcher is ignored by cmake generator {0}'.format(self.cmake_gen_target))
+        if not os.path.exists(self.compiler_cache_dir):
+            os.makedirs(self.compiler_cache_dir)
+        if os.path.basename(self.compiler_cache_launcher).lower().startswith('sccache'):
+            self.env['SCCACHE_DIR'] = self.compiler_cache_dir
+        else:
+            self.env['CCACHE_DIR'] = self.compiler_cache_dir
+
+    def record_compiler_cache_stats(self):
+        '''
+        remember compiler cache statistics before build, they are not zeroed as cache directory may be shared
+        with matrix children && other builds
+        '''
+        if not getattr(self, 'compiler_cache_launcher', None):
+            return
+        self.compiler_cache_stats = self.read_compiler_cache_stats()
+
+    def report_compiler_cache_stats(self):
+        '''
+        log compiler cache hit/miss statistics of this build, as difference to statistics recorded before build
+        '''
+        if not getattr(self, 'compiler_cache_launcher', None):
+            return
+        hits, misses = self.read_compiler_cache_stats()
+        last_hits, last_misses = getattr(self, 'compiler_cache_stats', (0, 0))
+        if hits >= last_hits and misses >= last_misses: # else statistics were zeroed meanwhile, e.g. sccache server restarted
+            hits, misses = hits - last_hits, misses - last_misses
+        total = hits + misses
+        self.logger.info(' * compiler cache : {0} hits, {1} misses, {2:.1f}% hit rate ({3})'.format( \
+            hits, misses, 100.0 * hits / total if total else 0.0, self.compiler_cache_dir))
+
+    def read_compiler_cache_stats(self):
+        '''
+        return (hits, misses) of compiler cache --show-stats
+        '''
+        stdout, _ = self.run_shell_command([self.compiler_cache_launcher, '--show-stats'], log_info=False)
+        self.logger.debug(stdout)
+        max_matches = None # ccache 3.x lists hits of direct && preprocessor mode in separate lines, they are summed
+        if os.path.basename(self.compiler_cache_launcher).lower().startswith('sccache'):
+            stats_patterns = COMPILER_CACHE_STATS_PATTERNS['sccache']
+        elif re.search(r'^\s*Hits:', stdout, flags=re.MULTILINE): # ccache 4.x
+            stats_patterns = COMPILER_CACHE_STATS_PATTERNS['ccache4']
+            max_matches = 1 # Hits/Misses of "Cacheable calls" are repeated under "Local storage" && "Remote storage"
+        else: # ccache 3.x
+            stats_patterns = COMPILER_CACHE_STATS_PATTERNS['ccache3']
+        hits, misses = [sum(int(n) for n in pattern.findall(stdout)[:max_matches]) for pattern in stats_patterns]
+        return hits, misses
+
+    def add_compiler_launcher_options(self):
+        '''
+        add CMAKE_<LANG>_COMPILER_LAUNCHER && CMAKE_<LANG>_LINKER_LAUNCHER for build profiling, resource scheduler,
+        distributed build && compiler cache
+        '''
+        compiler_launcher = []
+        linker_launcher = []
+        if self.profile_build:
+            self.build_profile_log = os.path.abspath(os.path.join(self.build_dir, BUILD_PROFILE_LOG_FILE)).replace(os.path.sep, '/')
+        if self.profile_build and 'ninja' != self.build_tool: # ninja records timing of every step in .ninja_log
+            profile_launcher = [sys.executable, self.launcher_script_path(), PROFILE_LAUNCHER_ARG, self.build_profile_log]
+            compiler_launcher.extend(profile_launcher + ['compile'])
+            if self.get_cmake_version() >= (3, 21):
+                linker_launcher.extend(profile_launcher + ['link'])
+            else:
+                self.logger.warning('CMAKE_<LANG>_LINKER_LAUNCHER needs cmake 3.21, link steps are not profiled')
+        if self.scheduler_config:
+            schedule_launcher = [sys.executable, self.launcher_script_path(), SCHEDULE_LAUNCHER_ARG, self.scheduler_config]
+            compiler_launcher.extend(schedule_launcher + ['compile'])
+            if self.get_cmake_version() >= (3, 21):
+                linker_launcher.extend(schedule_launcher + ['link'])
+        if self.distributed_config: # distributed build has its own object cache
+            compiler_launcher.extend([sys.executable, self.launcher_script_path(), DISTRIBUTED_LAUNCHER_ARG, self.distributed_config])
+        elif self.compiler_cache_launcher:
+            compiler_launcher.append(self.compiler_cache_launcher)
+        options = []
+        for lang in ['C', 'CXX']:
+            if compiler_launcher:
+                options.append('-DCMAKE_{0}_COMPILER_LAUNCHER={1}'.format(lang, ';'.join(compiler_launcher)))
+            if linker_launcher:
+                options.append('-DCMAKE_{0}_LINKER_LAUNCHER={1}'.format(lang, ';'.join(linker_launcher)))
+        self.add_cmake_options(options)
+
+    def launcher_script_path(self):
+        '''
+        path of this script compiled into build directory by write_generated_files, launchers run once per build step,
+        running compiled bytecode saves compiling this script every time
+        '''
+        self.launcher_script = os.path.abspath(os.path.join(self.build_dir, BUILD_LAUNCHER_FILE)).replace(os.path.sep, '/')
+        return self.launcher_script
+
+    def write_generated_files(self):
+        '''
+        write compiled launcher script, launcher configurations && pch script into build directory, after it is cleaned
+        '''
+        import py_compile
+        if getattr(self, 'launcher_script', None):
+            py_compile.compile(os.path.abspath(__file__), cfile = self.launcher_script, doraise = True)
+        if self.distributed_config:
+            self.write_text_file(self.distributed_config, json.dumps(self.distributed_config_data, indent=4, sort_keys=True))
+        if self.scheduler_config:
+            self.write_text_file(self.scheduler_config, json.dumps(self.scheduler_config_data, indent=4, sort_keys=True))
+        if self.pch:
+            self.write_text_file(os.path.join(self.build_dir, PCH_SCRIPT_FILE), PCH_SCRIPT)
+
+    ##############################################################################################
+    # distributed build
+    ##############################################################################################
+    def setup_distributed_build(self):
+        '''
+        check distributed build workers, start docker workers && write launcher configuration into build directory
+        '''
+        self.distributed_config = None
+        if not self.distributed_workers:
+            return
+        workers = []
+        for worker in self.distributed_workers:
+            if 'docker' == worker['transport'] and not worker['host']:
+                worker = dict(worker, host = self.get_docker_container_name() + '_worker')
+                self.ensure_docker_container(worker['host'], [])
+            transport = DISTRIBUTED_TRANSPORTS[worker['transport']](worker['host'])
+            return_code, _, stderr = self.run_process(transport.command('true'), log_info=False)
+            if 0 != return_code:
+                self.logger.warning('distributed build worker {0}:{1} not available, skipped : {2}'.format( \
+                    worker['transport'], worker['host'], stderr.strip()))
+                continue
+            self.logger.info(' * distributed build worker {0}:{1} with {2} slots'.format(worker['transport'], worker['host'], worker['slots']))
+            workers.append(worker)
+        if not workers:
+            self.logger.error('[ERROR] no distributed build worker available')
+            raise Exception('no distributed build worker available')
+        build_dir = os.path.abspath(self.build_dir)
+        self.distributed_config_data = {
+            'workers': workers,
+            'cache': self.distributed_cache,
+            'cache_size': self.distributed_cache_size,
+            # objects built by docker workers depend on toolchain image, others on local compiler, see distributed_object_key
+            'docker_toolchain': self.docker_toolchain_image,
+            'stats_file': os.path.join(build_dir, DISTRIBUTED_STATS_FILE),
+            'lock_dir': os.path.join(build_dir, DISTRIBUTED_LOCK_DIR),
+        }
+        self.distributed_config = os.path.join(build_dir, DISTRIBUTED_CONFIG_FILE).replace(os.path.sep, '/')
+        if self.compiler_cache_launcher:
+            self.logger.warning('compiler cache {0} is not used by distributed build, objects are cached in {1}'.format( \
+                self.compiler_cache_launcher, self.distributed_cache))
+
+    def report_distributed_build_stats(self):
+        '''
+        log where compile jobs of distributed build were done
+        '''
+        if not self.distributed_config:
+            return
+        counts = {}
+        for line in (self.read_text_file(DISTRIBUTED_STATS_FILE) or '').splitlines():
+            record = json.loads(line)
+            key = record['worker'] if 'remote' == record['result'] else record['result']
+            counts[key] = counts.get(key, 0) + 1
+        self.logger.info(' * distributed build : {0} compile jobs'.format(sum(counts.values())))
+        for key in sorted(counts.keys()):
+            self.logger.info(' *     {0:32} {1}'.format(key, counts[key]))
+
+    ##############################################################################################
+    # unity build && precompiled header
+    ##############################################################################################
+    def add_unity_build_options(self):
+        '''
+        add cmake cache options of --unity-build && --pch
+        '''
+        options = []
+        if self.unity_build:
+            if self.get_cmake_version() < (3, 16):
+                self.logger.warning('unity build needs cmake 3.16, --unity-build ignored')
+            else:
+                options.extend(['-DCMAKE_UNITY_BUILD=ON', '-DCMAKE_UNITY_BUILD_BATCH_SIZE={0}'.format(self.unity_build)])
+        if self.pch:
+            if not os.path.isfile(self.pch):
+                self.logger.error('[ERROR] precompiled header {0} not found'.format(self.pch))
+                raise Exception('precompiled header not found')
+            if self.get_cmake_version() < (3, 19):
+                self.logger.warning('precompiled header of every target needs cmake 3.19, --pch ignored')
+                self.pch = None
+            else:
+                pch_script = os.path.abspath(os.path.join(self.build_dir, PCH_SCRIPT_FILE)).replace(os.path.sep, '/')
+                options.extend(['-DCMAKE_PROJECT_INCLUDE=' + pch_script, '-DCMAKE_CPP_BUILDER_PCH=' + self.pch])
+        self.add_cmake_options(options)
+
+    def report_compile_times(self):
+        '''
+        record compile time of a full build by its unity build && pch settings, log compile times of all settings tried,
+        so unity build batch size && pch can be chosen from data
+        '''
+        import hashlib
+        if not getattr(self, 'full_compile', False) or not hasattr(self, 'compile_seconds'):
+            return # incremental builds are not comparable
+        path = os.path.join(get_cache_dir(), COMPILE_TIMES_DIR, hashlib.sha1(self.source_dir.encode('utf-8')).hexdigest() + '.json')
+        try:
+            with open(path, 'r') as f:
+                records = json.load(f)
+        except (IOError, OSError, ValueError):
+            records = {}
+        mode = 'unity {0}, pch {1}'.format(self.unity_build if self.unity_build else 'off', \
+            os.path.relpath(self.pch, self.source_dir).replace(os.path.sep, '/') if self.pch else 'off')
+        configuration = '{0} {1} -j{2}'.format(self.build_type, self.build_tool, self.jobs)
+        records.setdefault(configuration, {})[mode] = {'seconds': self.compile_seconds, 'finished_at': self.get_time_stamp()}
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        self.write_text_file(path, json.dumps(records, indent=4, sort_keys=True))
+        self.logger.info(' * compile times of full {0} builds :'.format(configuration))
+        for other_mode, record in sorted(records[configuration].items(), key = lambda item : item[1]['seconds']):
+            self.logger.info(' *     {0:32} {1:>9.2f}s  {2}'.format(other_mode, record['seconds'], \
+                '(this build)' if other_mode == mode else record['finished_at']))
+
+    def has_object_files(self):
+        '''
+        return True if build directory holds object files of an earlier build, compile is incremental then
+        '''
+        for r, dirs, files in os.walk(self.build_dir):
+            dirs[:] = [d for d in dirs if BUILD_TRASH_DIR != d]
+            if any(f.endswith(('.o', '.obj')) for f in files):
+                return True
+        return False
+
+    ##############################################################################################
+    # resource scheduler
+    ##############################################################################################
+    def setup_resource_scheduler(self):
+        '''
+        decide link job limit && prepare launcher configuration of resource scheduler
+
+        every compile && link job waits for a job slot, only first slots are open under memory pressure,
+        low memory or high load, so jobs already running go on && new ones are queued
+        '''
+        self.scheduler_config = None
+        if not self.resource_scheduler:
+            return
+        if not self.link_jobs:
+            available_memory = self.detect_available_memory()
+            self.link_jobs = max(1, self.jobs // 2)
+            if available_memory is not None and self.memory_per_job > 0:
+                self.link_jobs = max(1, min(self.link_jobs, available_memory // (2 * self.memory_per_job))) # linking takes more memory
+        build_dir = os.path.abspath(self.build_dir)
+        self.scheduler_config_data = {
+            'jobs': self.jobs,
+            'link_jobs': self.link_jobs,
+            'memory_per_job': self.memory_per_job,
+            'stats_file': os.path.join(build_dir, SCHEDULER_STATS_FILE),
+            'lock_dir': os.path.join(build_dir, SCHEDULER_LOCK_DIR),
+        }
+        self.scheduler_config = os.path.join(build_dir, SCHEDULER_CONFIG_FILE).replace(os.path.sep, '/')
+        allowed_jobs, reason = get_allowed_jobs(self.scheduler_config_data, self)
+        self.logger.info(' * resource scheduler : {0} jobs, {1} link jobs, {2} allowed now{3}'.format( \
+            self.jobs, self.link_jobs, allowed_jobs, ' ({0})'.format(reason) if reason else ''))
+        if 'ninja' == self.build_tool: # ninja limits link steps itself, also with cmake older than 3.21
+            self.add_cmake_options(['-DCMAKE_JOB_POOLS=link_pool={0}'.format(self.link_jobs), '-DCMAKE_JOB_POOL_LINK=link_pool'])
+        elif self.get_cmake_version() < (3, 21):
+            self.logger.warning('CMAKE_<LANG>_LINKER_LAUNCHER needs cmake 3.21, concurrent link steps are not limited')
+
+    def report_resource_scheduler_stats(self):
+        '''
+        log jobs throttled by resource scheduler && why
+        '''
+        if not self.scheduler_config:
+            return
+        n_jobs, wait_seconds, reasons = 0, 0.0, {}
+        for line in (self.read_text_file(SCHEDULER_STATS_FILE) or '').splitlines():
+            record = json.loads(line)
+            n_jobs += 1
+            wait_seconds += record['waited_seconds']
+            for reason in record['reasons']:
+                reasons[reason] = reasons.get(reason, 0) + 1
+        self.logger.info(' * resource scheduler : {0} jobs throttled, {1:.1f}s waited in total, link steps limited to {2}'.format( \
+            n_jobs, wait_seconds, self.link_jobs))
+        for reason in sorted(reasons.keys()):
+            self.logger.info(' *     {0:32} {1}'.format(reason, reasons[reason]))
+
+    ##############################################################################################
+    # build profile
+    ##############################################################################################
+    def collect_build_steps(self):
+        '''
+        return build steps of last build, each is dict of name, kind (compile, link or other), start, end && inputs
+        '''
+        if 'ninja' == self.build_tool:
+            return self.collect_ninja_build_steps()
+        steps = []
+        for line in (self.read_text_file(self.build_profile_log) or '').splitlines():
+            record = json.loads(line)
+            name = os.path.relpath(record['output'], self.build_dir).replace(os.path.sep, '/') if record['output'] else '?'
+            inputs = [os.path.relpath(i, self.build_dir).replace(os.path.sep, '/') for i in record['inputs']]
+            steps.append({'name': name, 'kind': record['kind'], 'start': record['start'], 'end': record['end'], 'inputs': inputs})
+        return steps
+
+    def collect_ninja_build_steps(self):
+        steps = {}
+        last_end = 0
+        for line in (self.read_text_file('.ninja_log') or '').splitlines():
+            fields = line.split('\t')
+            if line.startswith('#') or len(fields) < 5:
+                continue
+            start, end, name = int(fields[0]), int(fields[1]), fields[3]
+            if end < last_end:
+                steps = {} # log of a new ninja run starts, times restart from 0
+            last_end = end
+            if name.endswith(OBJECT_FILE_EXTENSIONS):
+                kind = 'compile'
+            elif name.endswith(LINK_OUTPUT_EXTENSIONS) or '.' not in os.path.basename(name):
+                kind = 'link'
+            else:
+                kind = 'other'
+            steps[name] = {'name': name, 'kind': kind, 'start': start / 1000.0, 'end': end / 1000.0, 'inputs': []}
+        # direct inputs of link steps from ninja build graph
+        link_steps = [name for name in steps if 'link' == steps[name]['kind']]
+        if link_steps:
+            stdout, _ = self.run_shell_command(['ninja', '-t', 'query'] + link_steps, log_info=False)
+            name, in_inputs = None, False
+            for line in stdout.splitlines():
+                if not line.startswith(' '):
+                    name, in_inputs = line.rstrip(':'), False
+                elif line.strip().startswith('input:'):
+                    in_inputs = True
+                elif line.strip().startswith('outputs:'):
+                    in_inputs = False
+                elif in_inputs and name in steps:
+                    steps[name]['inputs'].append(line.strip().lstrip('|').strip())
+        return list(steps.values())
+
+    def report_build_profile(self):
+        '''
+        log slowest compile && link steps && critical path, write chrome trace of build steps
+        '''
+        steps = self.collect_build_steps()
+        if not steps:
+            self.logger.info(' * build profile : no build step recorded')
+            return
+        for kind in ['compile', 'link']:
+            slowest = sorted([s for s in steps if kind == s['kind']], key=lambda s: s['start'] - s['end'])[:self.profile_top]
+            if slowest:
+                self.logger.info(' * slowest {0} steps :'.format(kind))
+            for step in slowest:
+                self.logger.info(' *   {0:8.2f}s  {1}'.format(step['end'] - step['start'], step['name']))
+        # critical path, longest chain of build steps through inputs
+        by_name = dict((s['name'], s) for s in steps)
+        longest = {}
+        def critical_path(name, visiting):
+            if name not in longest:
+                visiting.add(name)
+                step = by_name[name]
+                paths = [critical_path(i, visiting) for i in step['inputs'] if i in by_name and i not in visiting]
+                path = max(paths, key=lambda p: p[0]) if paths else (0.0, [])
+                longest[name] = (path[0] + step['end'] - step['start'], path[1] + [name])
+                visiting.discard(name)
+            return longest[name]
+        length, chain = max((critical_path(name, set()) for name in by_name), key=lambda p: p[0])
+        self.logger.info(' * critical path : {0:.2f}s, {1}'.format(length, ' -> '.join(chain)))
+        self.logger.info(' * build steps : {0}, {1:.2f}s in total, {2:.2f}s wall'.format(len(steps), \
+            sum(s['end'] - s['start'] for s in steps), max(s['end'] for s in steps) - min(s['start'] for s in steps)))
+        # chrome trace, steps are packed into lanes so that they do not overlap
+        origin = min(s['start'] for s in steps)
+        lane_ends = []
+        events = []
+        for step in sorted(steps, key=lambda s: s['start']):
+            lane = 0
+            while lane < len(lane_ends) and lane_ends[lane] > step['start']:
+                lane += 1
+            if lane == len(lane_ends):
+                lane_ends.append(0)
+            lane_ends[lane] = step['end']
+            events.append({'name': step['name'], 'cat': step['kind'], 'ph': 'X', 'pid': 1, 'tid': lane, \
+                'ts': int((step['start'] - origin) * 1000000), 'dur': int((step['end'] - step['start']) * 1000000)})
+        trace_path = os.path.join(self.build_dir, BUILD_PROFILE_TRACE_FILE).replace(os.path.sep, '/')
+        with open(trace_path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        self.logger.info(' * build trace written to {0}'.format(trace_path))
+
+    ##############################################################################################
+    # performance report
+    ##############################################################################################
+    def begin_phase(self, name):
+        '''
+        end current phase && start timing phase name
+        '''
+        self.end_phase()
+        self.current_phase = {'name': name, 'start': monotonic(), 'children_usage': self.get_children_usage()}
+
+    def end_phase(self):
+        phase = self.current_phase
+        if not phase:
+            return
+        self.current_phase = None
+        cpu_seconds, peak_rss_kb = self.get_children_usage()
+        self.phase_timings.append({
+            'name': phase['name'],
+            'seconds': monotonic() - phase['start'],
+            'child_cpu_seconds': cpu_seconds - phase['children_usage'][0] if cpu_seconds is not None else None,
+            'child_peak_rss_kb': peak_rss_kb, # peak of all children so far, rusage can not tell peak of a time span
+        })
+
+    def get_children_usage(self):
+        '''
+        return (cpu seconds, peak rss in KB) of all terminated child processes, (None, None) if not supported
+        '''
+        try:
+            import resource
+        except ImportError: # windows
+            return None, None
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        peak_rss_kb = usage.ru_maxrss // 1024 if 'Darwin' == host_system() else usage.ru_maxrss
+        return usage.ru_utime + usage.ru_stime, peak_rss_kb
+
+    def finish_build_report(self, result):
+        '''
+        log phase timings, write performance report && compare it with baseline if required
+        '''
+        import platform
+        self.report_finished = True
+        self.end_phase()
+        total_seconds = monotonic() - self.start_monotonic
+        self.logger.info(' * {0:24} {1:>10} {2:>12} {3:>14}'.format('phase', 'time', 'child cpu', 'child peak rss'))
+        for phase in self.phase_timings:
+            self.logger.info(' * {0:24} {1:>9.2f}s {2:>12} {3:>14}'.format(phase['name'], phase['seconds'], \
+                '{0:.2f}s'.format(phase['child_cpu_seconds']) if phase['child_cpu_seconds'] is not None else '-', \
+                '{0}KB'.format(phase['child_peak_rss_kb']) if phase['child_peak_rss_kb'] is not None else '-'))
+        self.logger.info(' * {0:24} {1:>9.2f}s'.format('total', total_seconds))
+        if not self.report:
+            return
+        report = {
+            'version': 1,
+            'result': result,
+            'finished_at': self.get_time_stamp(),
+            'platform': platform.platform(),
+            'source_dir': self.source_dir,
+            'build_dir': self.build_dir,
+            'build_type': self.build_type,
+            'build_tool': self.build_tool,
+            'jobs': self.jobs,
+            'targets': self.targets,
+            'total_seconds': total_seconds,
+            'phases': self.phase_timings,
+        }
+        if getattr(self, 'matrix_reports', None) is not None:
+            report['configurations'] = self.matrix_reports
+        with open(self.report_file, 'w') as f:
+            json.dump(report, f, indent=4, sort_keys=True)
+        self.logger.info('build report written to {0}'.format(self.report_file))
+        if self.report_baseline and 'passed' == result:
+            self.check_report_regression(report)
+
+    def check_report_regression(self, report):
+        with open(self.report_baseline, 'r') as f:
+            baseline = json.load(f)
+        baseline_seconds = dict((phase['name'], phase['seconds']) for phase in baseline.get('phases', []))
+        regressions = []
+        for phase in report['phases']:
+            if phase['name'] not in baseline_seconds or phase['seconds'] < REPORT_REGRESSION_MIN_SECONDS:
+                continue
+            limit = baseline_seconds[phase['name']] * (1.0 + self.report_tolerance / 100.0)
+            if phase['seconds'] > limit:
+                regressions.append(phase['name'])
+                self.logger.error('[ERROR] phase {0} took {1:.2f}s, baseline {2:.2f}s'.format(phase['name'], phase['seconds'], baseline_seconds[phase['name']]))
+        if regressions:
+            raise Exception('phases regressed against baseline {0} : {1}'.format(self.report_baseline, regressions))
+
     ##############################################################################################
     # utilities
     ##############################################################################################
@@ -446,110 +2153,1228 @@ Visual Studio 2012 [specify 2012 or 11 as MSVC_VERSION]
                 self.logger.debug(' * {0} : {1}'.format(attr, val))
                 
     def resotre_env(self):
+        self.begin_phase('cleanup')
         os.chdir(self.source_dir)
         if self.clean_after_build:
-            shutil.rmtree(self.build_dir)
+            self.clean_build_dir()
+        self.wait_trash_removal()
+
+    ##############################################################################################
+    # fast clean
+    ##############################################################################################
+    def clean_build_dir(self):
+        '''
+        move build directory into trash && remove it in background, so next build step starts immediately,
+        contents of build directory are moved instead if it is a mount point, e.g. docker volume of persistent container
+        '''
+        if not os.path.exists(self.build_dir):
+            self.start_trash_removal()
+            return
+        self.logger.info('removing ' + self.build_dir)
+        os.chdir(self.source_dir) # windows can not rename working directory
+        build_dir = os.path.abspath(self.build_dir)
+        try:
+            if os.path.ismount(build_dir):
+                trash = new_trash_path(os.path.join(build_dir, BUILD_TRASH_DIR), 'contents')
+                os.makedirs(trash)
+                for name in os.listdir(build_dir):
+                    if BUILD_TRASH_DIR != name:
+                        os.rename(os.path.join(build_dir, name), os.path.join(trash, name))
+            else:
+                trash = new_trash_path(os.path.join(os.path.dirname(build_dir), BUILD_TRASH_DIR), os.path.basename(build_dir))
+                if not os.path.exists(os.path.dirname(trash)):
+                    os.makedirs(os.path.dirname(trash))
+                os.rename(build_dir, trash)
+        except OSError as err: # e.g. a file in build directory is still open on windows
+            self.logger.warning('failed moving {0} into trash, removing it in place : {1}'.format(self.build_dir, err))
+            remove_tree(build_dir, TRASH_REMOVE_THREADS)
+            trash = None
+        self.start_trash_removal(trash)
+
+    def start_trash_removal(self, trash = None):
+        '''
+        remove trash in background thread, together with stale trash left by interrupted builds
+        '''
+        build_dir = os.path.abspath(self.build_dir)
+        paths = [trash] if trash else []
+        for trash_dir in [os.path.join(os.path.dirname(build_dir), BUILD_TRASH_DIR), os.path.join(build_dir, BUILD_TRASH_DIR)]:
+            if os.path.isdir(trash_dir):
+                paths.extend(os.path.join(trash_dir, name) for name in sorted(os.listdir(trash_dir)) if is_stale_trash(name))
+        if not paths:
+            return
+        def remove_trash():
+            for path in paths:
+                remove_tree(path, TRASH_REMOVE_THREADS)
+            for trash_dir in set(os.path.dirname(path) for path in paths):
+                try:
+                    os.rmdir(trash_dir)
+                except OSError: # trash of another build process still there
+                    pass
+        if len(paths) > 1 or not trash:
+            self.logger.info(' * removing {0} stale trash of interrupted builds in background'.format(len(paths) - (1 if trash else 0)))
+        remover = threading.Thread(target=remove_trash)
+        remover.daemon = True # trash left by an interrupted build is removed by a later one
+        remover.start()
+        self.trash_removers = getattr(self, 'trash_removers', []) + [remover]
+
+    def wait_trash_removal(self):
+        for remover in getattr(self, 'trash_removers', []):
+            if remover.is_alive():
+                self.logger.info('waiting for removal of cleaned build directory')
+            remover.join()
+        self.trash_removers = []
         
-    def run_shell_command(self, command, log_info=True):
+    def run_shell_command(self, command, log_info=True, capture=True):
+        '''
+        run command, stdout/stderr are read line by line && sent to logger as they arrive
+
+        return (stdout, stderr), whole output if capture, else last OUTPUT_TAIL_LINES lines of each
+        '''
+        _, stdout, stderr = self.run_process(command, log_info=log_info, capture=capture)
+        return stdout, stderr
+
+    def run_build_step(self, command, step_name, capture=False):
+        '''
+        run a build step && return its stdout, raise if it fails
+
+        pass or fail is decided by exit code, diagnostics in output are classified as they stream in,
+        with fail_fast the whole process tree is killed at first error
+        '''
+        def handle_line(line):
+            diagnostic = self.diagnostics.parse(line)
+            return self.fail_fast and diagnostic is not None and 'error' == diagnostic[0]
+        return_code, stdout, _ = self.run_process(command, capture=capture, line_handler=handle_line, new_process_group=self.fail_fast)
+        if 0 != return_code:
+            self.report_diagnostics()
+            self.logger.error('[ERROR] {0} failed with exit code {1}'.format(step_name, return_code))
+            raise Exception('{0} error'.format(step_name))
+        return stdout
+
+    def report_diagnostics(self):
+        self.logger.info(' * diagnostics : {0} errors, {1} warnings'.format(self.diagnostics.n_errors, self.diagnostics.n_warnings))
+        for severity, category, line in self.diagnostics.errors[:MAX_REPORTED_ERRORS]:
+            self.logger.info(' *   [{0}] {1}'.format(category, line))
+
+    def kill_process_tree(self, process, new_process_group, force = False):
+        '''
+        kill process && its descendants if it was started in new_process_group, by SIGTERM unless force is set
+        '''
+        import subprocess, signal
+        if 'Windows' == host_system():
+            subprocess.call(['taskkill', '/F', '/T', '/PID', str(process.pid)], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        elif new_process_group:
+            try:
+                os.killpg(process.pid, signal.SIGKILL if force else signal.SIGTERM)
+            except OSError: # already exited
+                pass
+        else:
+            process.kill()
+
+    def run_process(self, command, log_info=True, capture=True, log_prefix='', env=None, line_handler=None, new_process_group=False):
+        '''
+        same as run_shell_command, but return (return_code, stdout, stderr)
+
+        return_code is None if process could not be started, each logged line is prefixed with log_prefix,
+        line_handler is called with every output line, process tree is killed once it returns True,
+        new_process_group makes sure all descendants of process are killed then
+        '''
+        import subprocess
         if log_info:
-            self.logger.info('executing {0}'.format(command))
-        if 'Windows' == platform.system():
+            self.logger.info('{0}executing {1}'.format(log_prefix, command))
+        if 'Windows' == host_system():
             shell = True
-        elif 'Linux' == platform.system():
+        elif 'Linux' == host_system():
             shell = False
+        process_group_options = {}
+        if new_process_group and 'Windows' == host_system():
+            process_group_options['creationflags'] = subprocess.CREATE_NEW_PROCESS_GROUP
+        elif new_process_group:
+            process_group_options['preexec_fn'] = os.setsid
         try:
-            stdout, stderr = subprocess.Popen(command, \
-                shell=shell, env = self.env, universal_newlines = True, \
-                stdout = subprocess.PIPE, stderr = subprocess.PIPE
-            ).communicate()
+            process = subprocess.Popen(command, \
+                shell=shell, env = env if env is not None else self.env, \
+                stdout = subprocess.PIPE, stderr = subprocess.PIPE, **process_group_options
+            )
         except Exception as err:
             stdout, stderr = '', '{0}'.format(err)
-        if log_info:
-            self.logger.info(stdout)
-            self.logger.error(stderr)
-        return stdout, stderr
-        
+            if log_info:
+                self.logger.error(log_prefix + stderr)
+            return None, stdout, stderr
+        killed = []
+        def handle_line(line):
+            if line_handler(line) and not killed:
+                killed.append(True)
+                self.logger.error('{0}error found, killing {1}'.format(log_prefix, command[0]))
+                self.kill_process_tree(process, new_process_group)
+        # one reader thread per pipe, so neither pipe can fill up && block the process
+        outputs = []
+        readers = []
+        for stream, log in ((process.stdout, self.logger.info), (process.stderr, self.logger.error)):
+            lines = [] if capture else deque(maxlen=OUTPUT_TAIL_LINES)
+            reader = threading.Thread(target=self.pump_stream, \
+                args=(stream, lines, log if log_info else None, log_prefix, handle_line if line_handler else None))
+            reader.daemon = True
+            reader.start()
+            outputs.append(lines)
+            readers.append(reader)
+        for reader in readers:
+            reader.join()
+        process.wait()
+        stdout, stderr = [''.join(lines) for lines in outputs]
+        return process.returncode, stdout, stderr
+
+    def pump_stream(self, stream, lines, log=None, log_prefix='', line_handler=None):
+        '''
+        read stream line by line into lines (list or bounded deque), log each line if log given,
+        stream is always drained to its end, so the process never blocks on a full pipe
+
+        a \r progress line (e.g. of docker pull) is logged as its last state, && dropped if that is same as the one before,
+        count of dropped lines is logged with next different line
+        '''
+        last_progress, n_repeated = None, 0
+        try:
+            for line in iter(stream.readline, b''):
+                line = decode_output(line).replace('\r\n', '\n')
+                lines.append(line)
+                if line_handler:
+                    line_handler(line)
+                if not log:
+                    continue
+                content = line.rstrip('\r\n')
+                progress = content.rsplit('\r', 1)[-1] if '\r' in content else None
+                if progress is not None and progress == last_progress:
+                    n_repeated += 1
+                    continue
+                if n_repeated > 0:
+                    log('{0}(last line repeated {1} times)'.format(log_prefix, n_repeated))
+                last_progress, n_repeated = progress, 0
+                log(log_prefix + (content if progress is None else progress))
+            if log and n_repeated > 0:
+                log('{0}(last line repeated {1} times)'.format(log_prefix, n_repeated))
+        finally:
+            while stream.read(65536):
+                pass
+            stream.close()
+
     def close_log_files(self):
-        n_handlers = len(self.logger.handlers)
-        for i in range(n_handlers-1):
-            fh = self.logger.handlers.pop()
-            fh.close()
-            del fh
-            
+        '''
+        stop log writer thread after it wrote all queued records, close log file
+        '''
+        if getattr(self, 'log_listener', None):
+            self.log_listener.stop()
+            self.log_listener = None
+        for handler in self.logger.handlers:
+            if handler is not self.stream_handler:
+                handler.close()
+        if getattr(self, 'file_handler', None):
+            self.file_handler.close()
+            self.file_handler = None
+        self.logger.handlers = [self.stream_handler]
+
     def setup_logger(self):
-        if self.no_log_file:
-            return
+        '''
+        log through a bounded queue, console && log file are written by a log writer thread so the build never waits on them
+        '''
         self.close_log_files()
-        log_file_path = '{0}/build_{1}.log'.format(self.source_dir, self.get_time_stamp_word())
-        self.logger.addHandler(logging.FileHandler(log_file_path))
-        
+        QueueListener, BlockingQueueHandler, BatchedRotatingFileHandler = get_log_handler_classes()
+        handlers = [self.stream_handler]
+        if not self.no_log_file:
+            self.log_file_path = '{0}/build_{1}.log'.format(self.source_dir, self.get_time_stamp_word())
+            self.file_handler = BatchedRotatingFileHandler(self.log_file_path, \
+                max_bytes = self.log_max_size * 1024 * 1024, compress = self.log_compress)
+            handlers.append(self.file_handler)
+        if QueueListener:
+            from queue import Queue
+            self.log_listener = QueueListener(Queue(LOG_QUEUE_SIZE), *handlers)
+            self.logger.handlers = [BlockingQueueHandler(self.log_listener.queue)]
+            self.log_listener.start()
+        else:
+            self.logger.handlers = handlers
+
     def init_logger(self):
+        import logging
         self.logger = logging.getLogger("CMakeCPPBuilder")
         # add stream handler
         if 0 == len(self.logger.handlers):
             self.logger.addHandler(logging.StreamHandler())
+        self.stream_handler = self.logger.handlers[0]
         # add write function for print traceback
         self.logger.write = self.logger.error
         
     def get_time_stamp(self):
+        from datetime import datetime
         return datetime.fromtimestamp(time.time()).strftime('%Y/%m/%d_%H:%M:%S')
     
     def get_time_stamp_word(self):
+        from datetime import datetime
         return datetime.fromtimestamp(time.time()).strftime('%Y-%m-%d_%H-%M-%S')
     
+    def get_cmake_version(self):
+        '''
+        version tuple of probed cmake, (0, 0) if unknown, cmake is probed if build environment not checked yet
+        '''
+        if 'CMake' in getattr(self, 'tool_versions', {}):
+            version = self.tool_versions['CMake']
+        else:
+            version, _ = self.check_tool('CMake', 'cmake', self.load_tool_cache())
+        res = re.findall(r'^(\d+)\.(\d+)', version or '')
+        return (int(res[0][0]), int(res[0][1])) if res else (0, 0)
+
+    def add_cmake_options(self, options):
+        '''
+        add options to cmake_command, before source directory which is always the last
+        '''
+        self.cmake_command[-1:-1] = options
+
+    def read_text_file(self, path):
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as f:
+            return f.read()
+
+    def write_text_file(self, path, content):
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def detect_cpu_count(self):
+        '''
+        number of cpus this process may use, respecting cpu affinity && cgroup cpu quota
+        '''
+        if hasattr(os, 'sched_getaffinity'):
+            cpus = len(os.sched_getaffinity(0))
+        else:
+            import multiprocessing
+            cpus = multiprocessing.cpu_count()
+        quota, period = None, None
+        cpu_max = self.read_text_file('/sys/fs/cgroup/cpu.max') # cgroup v2, e.g. "200000 100000" or "max 100000"
+        if cpu_max and not cpu_max.startswith('max'):
+            quota, period = [int(v) for v in cpu_max.split()[:2]]
+        else:
+            cfs_quota = self.read_text_file('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') # cgroup v1
+            cfs_period = self.read_text_file('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+            if cfs_quota and cfs_period and int(cfs_quota) > 0:
+                quota, period = int(cfs_quota), int(cfs_period)
+        if quota and period:
+            cpus = min(cpus, max(1, (quota + period - 1) // period))
+        return cpus
+
+    def detect_available_memory(self):
+        '''
+        available memory in MB, respecting cgroup memory limit, None if unknown
+        '''
+        available = None
+        if 'Windows' == host_system():
+            import ctypes
+            class MEMORYSTATUSEX(ctypes.Structure):
+                _fields_ = [('dwLength', ctypes.c_ulong), ('dwMemoryLoad', ctypes.c_ulong),
+                    ('ullTotalPhys', ctypes.c_ulonglong), ('ullAvailPhys', ctypes.c_ulonglong),
+                    ('ullTotalPageFile', ctypes.c_ulonglong), ('ullAvailPageFile', ctypes.c_ulonglong),
+                    ('ullTotalVirtual', ctypes.c_ulonglong), ('ullAvailVirtual', ctypes.c_ulonglong),
+                    ('sullAvailExtendedVirtual', ctypes.c_ulonglong)]
+            status = MEMORYSTATUSEX()
+            status.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+            if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+                available = status.ullAvailPhys // (1024 * 1024)
+            return available
+        meminfo = self.read_text_file('/proc/meminfo')
+        if meminfo:
+            res = re.findall(r'MemAvailable:\s+(\d+) kB', meminfo)
+            if len(res) == 1:
+                available = int(res[0]) // 1024
+        for limit_file, usage_file in (('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory.current'), \
+                ('/sys/fs/cgroup/memory/memory.limit_in_bytes', '/sys/fs/cgroup/memory/memory.usage_in_bytes')):
+            limit, usage = self.read_text_file(limit_file), self.read_text_file(usage_file)
+            if limit and usage and limit.strip().isdigit():
+                cgroup_available = max(0, int(limit) - int(usage)) // (1024 * 1024)
+                available = cgroup_available if available is None else min(available, cgroup_available)
+                break
+        return available
+
+    def detect_default_jobs(self, memory_per_job = DEFAULT_MEMORY_PER_JOB):
+        jobs = self.detect_cpu_count()
+        available_memory = self.detect_available_memory()
+        if available_memory is not None and memory_per_job > 0:
+            jobs = min(jobs, available_memory // memory_per_job)
+        return max(1, jobs)
+
     def add_path_to_env(self, path):
         self.env['PATH'] = path + os.pathsep + self.env['PATH']
 
-    def check_tool(self, tool_name, command):
-        stdout, stderr = self.run_shell_command([command, '--version'], log_info=False)
+    def find_executable(self, command):
+        '''
+        resolve command to full path through PATH in self.env, None if not found
+        '''
+        extensions = ['']
+        if 'Windows' == host_system():
+            extensions += self.env.get('PATHEXT', '.EXE;.BAT;.CMD').lower().split(';')
+        for dir in self.env.get('PATH', '').split(os.pathsep):
+            for ext in extensions:
+                path = os.path.join(dir, command + ext)
+                if os.path.isfile(path) and os.access(path, os.X_OK):
+                    return os.path.abspath(path)
+        return None
+
+    def parse_tool_version(self, data_source):
+        for pattern in TOOL_VERSION_PATTERNS:
+            res = pattern.findall(data_source)
+            if len(res) == 1:
+                return res[0]
+        return None
+
+    def check_tool(self, tool_name, command, tool_cache = None):
+        '''
+        return (version, version output) of tool, cached in tool_cache by resolved path && mtime
+        '''
+        path = self.find_executable(command)
+        if not path:
+            return None, '{0} not found in PATH\n'.format(command)
+        stat = os.stat(path)
+        cache_key = '{0}|{1}|{2}'.format(path, stat.st_mtime, stat.st_size)
+        if tool_cache is not None and cache_key in tool_cache:
+            cached = tool_cache[cache_key]
+            return cached['version'], cached['output']
+        stdout, stderr = self.run_shell_command([path, '--version'], log_info=False)
         if len(stdout) > 1:
             data_source = stdout
         else:
             data_source = stderr
-        version = None
-        if not version:
-            res = re.findall(r'\d+(?:\.\d+)+\s\d+\s\(Red\sHat\s[\.\-\w]+\)', data_source, flags=re.IGNORECASE) # redhat e.g. gcc (GCC) 4.9.2 20150212 (Red Hat 4.9.2-6)
-            if len(res) == 1:
-                version = res[0]
-        if not version:
-            res = re.findall(r'\(Ubuntu\s[\.\-\~\w]+\)\s\d+(?:\.\d+)+\s\d+', data_source, flags=re.IGNORECASE) # ubuntu e.g. gcc (Ubuntu 5.4.0-6ubuntu1~16.04.11) 5.4.0 20160609
-            if len(res) == 1:
-                version = res[0]
-        if not version:
-            res = re.findall(r'\d+(?:\.\d+)+(?:[\.\-]?\w+)+', data_source, flags=re.IGNORECASE) # e.g. git version 1.7.windows.1
-            if len(res) == 1:
-                version = res[0]
-        if not version:
-            res = re.findall(r'\d+(?:\.\d+)+', data_source, flags=re.IGNORECASE) # common version , e.g. 3.1.1
-            if len(res) == 1:
-                version = res[0]
-        if not version:
-            self.logger.debug(' * {0:8} : not found'.format(tool_name))
-            #self.logger.debug(data_source)
-            #self.logger.debug(res)
-        else:
-            self.logger.debug(' * {0:8} : {1}'.format(tool_name, res[0]))
-        self.full_version_check_log += '@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{0}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@\n'.format(tool_name.center(8))
-        self.full_version_check_log += data_source + '\n'
-    
+        version = self.parse_tool_version(data_source)
+        if tool_cache is not None:
+            tool_cache[cache_key] = {'version': version, 'output': data_source}
+        return version, data_source
+
+    def load_tool_cache(self):
+        try:
+            with open(os.path.join(get_cache_dir(), TOOL_CACHE_FILE), 'r') as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def save_tool_cache(self, tool_cache):
+        cache_dir = get_cache_dir()
+        cache_path = os.path.join(cache_dir, TOOL_CACHE_FILE)
+        temp_path = '{0}.{1}'.format(cache_path, os.getpid())
+        try:
+            if not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            with open(temp_path, 'w') as f:
+                json.dump(tool_cache, f, indent=4, sort_keys=True)
+            if os.path.exists(cache_path) and 'Windows' == host_system():
+                os.remove(cache_path) # rename does not overwrite on windows
+            os.rename(temp_path, cache_path)
+        except (IOError, OSError) as err:
+            self.logger.warning('failed saving tool version cache {0} : {1}'.format(cache_path, err))
+
     def check_build_environment(self):
+        import platform
+        from multiprocessing.pool import ThreadPool
+        self.begin_phase('toolchain_probe')
         self.logger.debug('##############################################################################################')
         self.logger.debug('# checking build environment')
         self.logger.debug('##############################################################################################')
         self.logger.debug(' * ' + platform.platform())
         self.logger.debug(' * {0:8} : {1}'.format('Python', platform.python_version()))
+        if self.probed_toolchain:
+            # toolchain already probed by matrix build parent or build daemon
+            self.tool_versions = self.probed_toolchain['tool_versions']
+            self.full_version_check_log = self.probed_toolchain['full_version_check_log']
+            self.logger.debug(' * toolchain probed by parent build : {0}'.format(self.tool_versions))
+            return
         self.full_version_check_log = ''
-        self.check_tool('CMake', 'cmake')
-        self.check_tool('Git', 'git')
-        self.check_tool('GNU Make', 'make')
-        self.check_tool('Ninja', 'ninja')
-        self.check_tool('GCC', 'gcc')
-        self.check_tool('CC', 'cc')
-        self.check_tool('g++', 'g++')
-        self.check_tool('c++', 'c++')
+        self.tool_versions = {}
+        # probe tools concurrently, versions are cached by resolved path && mtime
+        tool_cache = self.load_tool_cache()
+        n_cached = len(tool_cache)
+        pool = ThreadPool(len(TOOLS_TO_CHECK))
+        try:
+            results = pool.map(lambda tool : self.check_tool(tool[0], tool[1], tool_cache), TOOLS_TO_CHECK)
+        finally:
+            pool.close()
+            pool.join()
+        if len(tool_cache) != n_cached:
+            self.save_tool_cache(tool_cache)
+        for (tool_name, _), (version, data_source) in zip(TOOLS_TO_CHECK, results):
+            self.tool_versions[tool_name] = version
+            if not version:
+                self.logger.debug(' * {0:8} : not found'.format(tool_name))
+            else:
+                self.logger.debug(' * {0:8} : {1}'.format(tool_name, version))
+            self.full_version_check_log += '@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{0}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@\n'.format(tool_name.center(8))
+            self.full_version_check_log += data_source + '\n'
         self.logger.debug(self.full_version_check_log)
-        
+
+
+class DiagnosticsParser(object):
+    '''
+    classify GCC/Clang/MSVC/linker/CMake/build tool diagnostics from build output lines, thread safe
+    '''
+    # (severity, category, pattern), first matching pattern classifies a line
+    PATTERNS = [
+        (None, 'compile', re.compile(r'^[^\s:][^:]*:\d+(?::\d+)?:\s+note:')),
+        ('error', 'compile', re.compile(r'^[^\s:][^:]*:\d+(?::\d+)?:\s+(?:fatal error|error):')), # gcc/clang main.cpp:3:5: error: ...
+        ('warning', 'compile', re.compile(r'^[^\s:][^:]*:\d+(?::\d+)?:\s+warning:')),
+        ('error', 'compile', re.compile(r'^\s*\S.*?\(\d+(?:,\d+)?\)\s*:\s*(?:fatal error|error)\s+C\d+')), # msvc main.cpp(3): error C2065: ...
+        ('warning', 'compile', re.compile(r'^\s*\S.*?\(\d+(?:,\d+)?\)\s*:\s*warning\s+C\d+')),
+        ('error', 'link', re.compile(r'undefined reference to|multiple definition of|collect2: error:|linker command failed|\bld(?:\.\w+)?: (?:error|cannot find)')),
+        ('error', 'link', re.compile(r'^\s*(?:\S+\.obj|LINK|\S+\.exe|\S+\.dll|\S+\.lib)\s*:\s*(?:fatal error|error)\s+LNK\d+')),
+        ('warning', 'link', re.compile(r'^\s*\S+\s*:\s*warning\s+LNK\d+')),
+        ('error', 'compile', re.compile(r'^(?:cc1\w*|gcc|g\+\+|c\+\+|cc|clang\+*|cl)(?:\.exe)?: (?:fatal error|error):')),
+        ('error', 'cmake', re.compile(r'^CMake Error\b')),
+        ('warning', 'cmake', re.compile(r'^CMake (?:Deprecation )?Warning\b')),
+        # job control messages make prints after a failed job are no errors, its "*** [target] Error N" lines are
+        (None, 'build tool', re.compile(r'^make(?:\[\d+\])?: (?:\*\*\* )?(?:Waiting for unfinished jobs|wait: |Deleting (?:intermediate )?file)')),
+        ('error', 'build tool', re.compile(r'^make(?:\[\d+\])?: \*\*\* |^ninja: build stopped|^FAILED: |\berror MSB\d+')),
+        ('warning', 'build tool', re.compile(r'\bwarning MSB\d+')),
+    ]
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.n_errors = 0
+        self.n_warnings = 0
+        self.errors = []
+        self.seen = set()
+
+    def parse(self, line):
+        '''
+        return (severity, category, line) of a diagnostic line, None for other lines
+        '''
+        line = line.rstrip('\r\n')
+        for severity, category, pattern in self.PATTERNS:
+            if pattern.search(line):
+                break
+        else:
+            return None
+        if not severity:
+            return None
+        diagnostic = (severity, category, line.strip())
+        with self.lock:
+            if diagnostic in self.seen: # msbuild repeats all diagnostics at the end
+                return diagnostic
+            self.seen.add(diagnostic)
+            if 'error' == severity:
+                self.n_errors += 1
+                self.errors.append(diagnostic)
+            else:
+                self.n_warnings += 1
+        return diagnostic
+
+
+# log handler classes, built by get_log_handler_classes on first use
+LOG_HANDLER_CLASSES = None
+
+
+def get_log_handler_classes():
+    '''
+    (QueueListener, BlockingQueueHandler, BatchedRotatingFileHandler), queue classes are None on python 2,
+    logging.handlers is imported on first use as it pulls in socket && pickle
+    '''
+    global LOG_HANDLER_CLASSES
+    if LOG_HANDLER_CLASSES:
+        return LOG_HANDLER_CLASSES
+    import logging.handlers
+
+    class BatchedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+        '''
+        log file handler flushing at most once per LOG_FLUSH_INTERVAL, rotated files are gzip compressed if compress
+        '''
+        def __init__(self, filename, max_bytes = 0, compress = False):
+            logging.handlers.RotatingFileHandler.__init__(self, filename, maxBytes = max_bytes, backupCount = 1000 if max_bytes else 0)
+            self.last_flush = monotonic()
+            if compress:
+                self.namer = lambda name : name + '.gz'
+                self.rotator = self.compress_rotated
+
+        def flush(self):
+            if monotonic() - self.last_flush >= LOG_FLUSH_INTERVAL:
+                self.last_flush = monotonic()
+                logging.handlers.RotatingFileHandler.flush(self)
+
+        def close(self):
+            self.acquire()
+            try:
+                if self.stream:
+                    self.stream.flush()
+            finally:
+                self.release()
+            logging.handlers.RotatingFileHandler.close(self)
+
+        def compress_rotated(self, source, dest):
+            import shutil, gzip
+            with open(source, 'rb') as f_in:
+                with gzip.open(dest, 'wb') as f_out:
+                    shutil.copyfileobj(f_in, f_out)
+            os.remove(source)
+
+    try:
+        from logging.handlers import QueueHandler, QueueListener
+    except ImportError: # python 2, logging stays synchronous
+        LOG_HANDLER_CLASSES = (None, None, BatchedRotatingFileHandler)
+        return LOG_HANDLER_CLASSES
+
+    class BlockingQueueHandler(QueueHandler):
+        '''
+        queue handler waiting for free space in bounded queue, instead of failing when it is full
+        '''
+        def enqueue(self, record):
+            self.queue.put(record)
+
+    LOG_HANDLER_CLASSES = (QueueListener, BlockingQueueHandler, BatchedRotatingFileHandler)
+    return LOG_HANDLER_CLASSES
+
+
+class DirectoryArtifactCache(object):
+    '''
+    artifact cache backend keeping one archive per key in a local or shared directory,
+    least recently used archives are evicted when total size exceeds max_size_mb
+    '''
+    def __init__(self, root, max_size_mb, suffix = '.tar.gz'):
+        self.root = root
+        self.max_size = max_size_mb * 1024 * 1024
+        self.suffix = suffix
+
+    def __str__(self):
+        return 'dir:' + self.root
+
+    def archive_path(self, key):
+        return os.path.join(self.root, key[:2], key + self.suffix)
+
+    def fetch(self, key, dest_path):
+        import shutil
+        path = self.archive_path(key)
+        if not os.path.exists(path):
+            return False
+        try:
+            shutil.copyfile(path, dest_path)
+            os.utime(path, None) # mark as recently used
+        except (IOError, OSError):
+            return False
+        return True
+
+    def store(self, key, archive_path):
+        import shutil, platform
+        path = self.archive_path(key)
+        if os.path.exists(path):
+            return
+        if not os.path.exists(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError: # created by another agent meanwhile
+                pass
+        temp_path = '{0}.{1}.{2}.tmp'.format(path, platform.node(), os.getpid())
+        shutil.copyfile(archive_path, temp_path)
+        if os.path.exists(path) and 'Windows' == host_system():
+            os.remove(temp_path) # rename does not overwrite on windows, same key is same content
+        else:
+            os.rename(temp_path, path) # atomic, readers on other agents never see partial archive
+        self.evict()
+
+    def evict(self):
+        archives = []
+        for dir, _, files in os.walk(self.root):
+            for file in files:
+                if file.endswith(self.suffix):
+                    path = os.path.join(dir, file)
+                    stat = os.stat(path)
+                    archives.append((stat.st_mtime, stat.st_size, path))
+        total_size = sum(size for _, size, _ in archives)
+        for _, size, path in sorted(archives):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+                total_size -= size
+            except OSError: # removed by another agent
+                pass
+
+
+class ParallelGzipWriter(object):
+    '''
+    write only file object gzip compressing data into fileobj with threads, like pigz,
+    data is cut into blocks compressed in parallel as independent gzip members, concatenated members are a valid gzip stream
+    '''
+    def __init__(self, fileobj, threads, level = 6, block_size = PACKAGE_BLOCK_SIZE):
+        from multiprocessing.pool import ThreadPool
+        self.fileobj = fileobj
+        self.level = level
+        self.block_size = block_size
+        self.blocks = []
+        self.buffered = 0
+        self.pending = deque()
+        self.max_pending = threads * 2 # bounds memory, compressed blocks are written in order
+        self.pool = ThreadPool(threads)
+
+    def compress(self, data):
+        import zlib # releases gil while compressing
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress(data) + compressor.flush()
+
+    def write(self, data):
+        self.blocks.append(data)
+        self.buffered += len(data)
+        if self.buffered >= self.block_size:
+            self.submit_block()
+
+    def submit_block(self):
+        if self.buffered > 0:
+            self.pending.append(self.pool.apply_async(self.compress, (b''.join(self.blocks),)))
+            self.blocks = []
+            self.buffered = 0
+        while len(self.pending) >= self.max_pending:
+            self.fileobj.write(self.pending.popleft().get())
+
+    def close(self):
+        if self.pool is None:
+            return
+        try:
+            self.submit_block()
+            while self.pending:
+                self.fileobj.write(self.pending.popleft().get())
+        finally:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+
+# artifact cache backends, by name used in --artifact-cache
+ARTIFACT_CACHE_BACKENDS = {
+    'dir': DirectoryArtifactCache,
+}
+
+
+def create_artifact_cache(spec, max_size_mb, suffix = '.tar.gz'):
+    '''
+    create artifact cache backend from [<backend>:]<location>, suffix is file name suffix of cached entries
+    '''
+    backend, sep, location = spec.partition(':')
+    if not sep or len(backend) == 1: # no backend or windows drive letter
+        backend, location = 'dir', spec
+    if backend not in ARTIFACT_CACHE_BACKENDS:
+        raise Exception('artifact cache backend {0} not supported'.format(backend))
+    return ARTIFACT_CACHE_BACKENDS[backend](os.path.abspath(os.path.expanduser(location)), max_size_mb, suffix)
+
+
+def new_trash_path(trash_dir, name):
+    '''
+    path of a new trash entry in trash_dir, named <name>.<pid>.<creation time> so stale ones can be recognized
+    '''
+    return os.path.join(trash_dir, '{0}.{1}.{2}'.format(name, os.getpid(), int(time.time())))
+
+
+def is_stale_trash(name):
+    '''
+    True if trash entry is left by a build process which is no longer running
+    '''
+    parts = name.rsplit('.', 2)
+    if len(parts) != 3 or not parts[1].isdigit() or not parts[2].isdigit():
+        return False
+    pid, created = int(parts[1]), int(parts[2])
+    if pid == os.getpid():
+        return False # removed by its own remover thread
+    if 'Windows' != host_system():
+        import errno
+        try:
+            os.kill(pid, 0)
+        except OSError as err:
+            return errno.ESRCH == err.errno
+    return time.time() - created > TRASH_STALE_SECONDS # os.kill terminates process on windows, pid may also be reused
+
+
+def remove_tree(path, threads):
+    '''
+    remove directory tree with a thread pool, sub trees of its first two levels are removed in parallel, read only files too
+    '''
+    import shutil, stat
+    def remove_read_only(function, path, exc_info):
+        try:
+            os.chmod(path, stat.S_IWRITE)
+            function(path)
+        except OSError: # removed meanwhile
+            pass
+    def remove(path):
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, onerror=remove_read_only)
+        else:
+            try:
+                os.remove(path)
+            except OSError:
+                remove_read_only(os.remove, path, None)
+    if not os.path.isdir(path) or os.path.islink(path):
+        remove(path)
+        return
+    sub_trees = []
+    for entry in scandir(path):
+        if entry.is_dir(follow_symlinks=False):
+            sub_trees.extend(child.path for child in scandir(entry.path))
+        else:
+            sub_trees.append(entry.path)
+    if sub_trees:
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(min(threads, len(sub_trees)))
+        try:
+            pool.map(remove, sub_trees)
+        finally:
+            pool.close()
+            pool.join()
+    remove(path)
+
+
+def read_memory_pressure():
+    '''
+    (some, full) avg10 memory pressure in percent, max of system && cgroup, None if pressure stall information is not available
+    '''
+    pressure = None
+    for path in ['/proc/pressure/memory', '/sys/fs/cgroup/memory.pressure']:
+        try:
+            with open(path, 'r') as f:
+                values = dict((line.split()[0], float(line.split()[1].split('=')[1])) for line in f if line.strip())
+        except (IOError, OSError, IndexError, ValueError):
+            continue
+        current = (values.get('some', 0.0), values.get('full', 0.0))
+        pressure = current if pressure is None else (max(pressure[0], current[0]), max(pressure[1], current[1]))
+    return pressure
+
+
+def get_allowed_jobs(config, builder):
+    '''
+    number of jobs allowed to run by memory pressure, available memory && load average, with reason if throttled
+    '''
+    allowed, reasons = config['jobs'], []
+    pressure = read_memory_pressure()
+    if pressure and pressure[1] > SCHEDULER_MEMORY_PRESSURE_LIMIT:
+        allowed = 1
+        reasons.append('memory pressure')
+    elif pressure and pressure[0] > SCHEDULER_MEMORY_PRESSURE_LIMIT:
+        allowed = max(1, allowed // 2)
+        reasons.append('memory pressure')
+    available_memory = builder.detect_available_memory()
+    if available_memory is not None and available_memory < config['memory_per_job']:
+        allowed = 1
+        reasons.append('low memory')
+    if hasattr(os, 'getloadavg'):
+        load = os.getloadavg()[0]
+        load_limit = builder.detect_cpu_count() * SCHEDULER_LOAD_LIMIT
+        if load > load_limit:
+            allowed = max(1, min(allowed, int(config['jobs'] * load_limit / load)))
+            reasons.append('high load')
+    return allowed, ', '.join(reasons) if reasons else None
+
+
+def try_slot_lock(lock_dir, prefix, count, block = False):
+    '''
+    lock first free one of count slots, return its lock file, None if all are busy, wait for one if block
+    '''
+    import fcntl
+    if not os.path.exists(lock_dir):
+        try:
+            os.makedirs(lock_dir)
+        except OSError: # created by another launcher meanwhile
+            pass
+    for i in range(count + (1 if block else 0)):
+        lock_file = open(os.path.join(lock_dir, '{0}_{1}.lock'.format(prefix, i % count if i < count else os.getpid() % count)), 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (fcntl.LOCK_NB if i < count else 0))
+            return lock_file
+        except (IOError, OSError):
+            lock_file.close()
+    return None
+
+
+def run_schedule_launcher(args):
+    '''
+    compile/link launcher of resource scheduler, args are : launcher configuration, kind (compile or link), command to run
+    '''
+    import subprocess
+    with open(args[0], 'r') as f:
+        config = json.load(f)
+    kind, command = args[1], args[2:]
+    builder = CMakeCPPBuilder()
+    start = monotonic()
+    reasons = set()
+    locks = []
+    try:
+        if 'link' == kind:
+            link_lock = try_slot_lock(config['lock_dir'], 'link', config['link_jobs'])
+            if not link_lock:
+                reasons.add('link limit')
+                link_lock = try_slot_lock(config['lock_dir'], 'link', config['link_jobs'], block = True)
+            locks.append(link_lock)
+        while True:
+            allowed, reason = get_allowed_jobs(config, builder)
+            job_lock = try_slot_lock(config['lock_dir'], 'job', allowed)
+            if job_lock:
+                locks.append(job_lock)
+                break
+            reasons.add(reason if reason else 'job limit')
+            time.sleep(SCHEDULER_POLL_INTERVAL)
+        if reasons:
+            with open(config['stats_file'], 'a') as f:
+                f.write(json.dumps({'kind': kind, 'waited_seconds': monotonic() - start, 'reasons': sorted(reasons)}) + '\n')
+        return subprocess.call(command)
+    finally:
+        for lock in locks:
+            lock.close()
+
+
+class LocalTransport(object):
+    '''
+    stand-in worker host running compile jobs as local processes, for trying distributed build on one machine
+    '''
+    def __init__(self, host):
+        self.host = host
+
+    def command(self, script):
+        return ['sh', '-c', script]
+
+
+class SSHTransport(object):
+    '''
+    worker host reached by ssh, it needs same compiler at same path as local host
+    '''
+    def __init__(self, host):
+        self.host = host
+
+    def command(self, script):
+        return ['ssh', '-o', 'BatchMode=yes', '-T', self.host, script]
+
+
+class DockerTransport(object):
+    '''
+    worker container, running compile jobs with docker exec
+    '''
+    def __init__(self, host):
+        self.host = host
+
+    def command(self, script):
+        return ['docker', 'exec', '-i', self.host, 'sh', '-c', script]
+
+
+# distributed build transports, by name used in --distributed-workers
+DISTRIBUTED_TRANSPORTS = {
+    'local': LocalTransport,
+    'ssh': SSHTransport,
+    'docker': DockerTransport,
+}
+
+
+def parse_distributed_workers(spec):
+    '''
+    parse --distributed-workers, return list of dict of transport, host && slots
+    '''
+    workers = []
+    for item in spec.split(','):
+        item, _, slots = item.strip().partition('*')
+        transport, sep, host = item.partition(':')
+        if not sep and transport in ['local', 'docker']:
+            host = None if 'docker' == transport else 'localhost'
+        elif not sep:
+            transport, host = 'ssh', item
+        if transport not in DISTRIBUTED_TRANSPORTS:
+            raise Exception('distributed build transport {0} not supported'.format(transport))
+        if not slots.isdigit() and slots:
+            raise Exception('invalid slots of distributed build worker {0}'.format(item))
+        workers.append({'transport': transport, 'host': host, 'slots': int(slots) if slots else 1})
+    return workers
+
+
+def split_compile_command(command):
+    '''
+    split compile command of one source file, return (source, output, preprocess_command, remote_compile_args),
+    None if command is not a plain compile distributed build can handle
+    '''
+    if '-c' not in command or '-o' not in command[:-1] or any(a in command for a in ['-E', '-S', '-M', '-MM']):
+        return None
+    sources = [a for a in command[1:] if os.path.splitext(a)[1] in DISTRIBUTED_SOURCE_EXTENSIONS and os.path.isfile(a)]
+    if len(sources) != 1:
+        return None
+    source, output = sources[0], command[command.index('-o') + 1]
+    preprocess_command, remote_args = [], []
+    skip_value = False
+    for i, arg in enumerate(command):
+        if skip_value:
+            skip_value = False
+            continue
+        if arg in ['-o', '-MF', '-MT', '-MQ', '-include', '-imacros']:
+            skip_value = True
+            if '-o' != arg:
+                preprocess_command.extend(command[i:i + 2])
+        elif arg == source or '-c' == arg:
+            preprocess_command.append(arg)
+        elif arg in ['-MD', '-MMD', '-MP'] or arg.startswith(('-MF', '-MT', '-MQ')):
+            preprocess_command.append(arg)
+        else:
+            preprocess_command.append(arg)
+            remote_args.append(arg)
+    preprocess_command = ['-E' if '-c' == a else a for a in preprocess_command] + ['-o', output + '.distributed.i']
+    if ('-MD' in command or '-MMD' in command) and not any(a.startswith(('-MT', '-MQ')) for a in command):
+        preprocess_command.extend(['-MT', output]) # dependency target would be the preprocessed file otherwise
+    return source, output, preprocess_command, remote_args
+
+
+def acquire_distributed_slot(config):
+    '''
+    lock a free worker slot, wait for one if all are busy, return (worker, lock file)
+    '''
+    import fcntl
+    slots = [(worker, i) for worker in config['workers'] for i in range(worker['slots'])]
+    if not os.path.exists(config['lock_dir']):
+        try:
+            os.makedirs(config['lock_dir'])
+        except OSError: # created by another launcher meanwhile
+            pass
+    first = os.getpid() % len(slots)
+    for n in range(len(slots) + 1):
+        worker, i = slots[(first + n) % len(slots)]
+        lock_file = open(os.path.join(config['lock_dir'], '{0}_{1}_{2}.lock'.format(worker['transport'], worker['host'], i)), 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (fcntl.LOCK_NB if n < len(slots) else 0))
+            return worker, lock_file
+        except (IOError, OSError):
+            lock_file.close()
+
+
+def run_distributed_launcher(args):
+    '''
+    compiler launcher of distributed build, args are : launcher configuration, compile command
+
+    source is preprocessed locally, object is taken from shared object cache or compiled by a worker,
+    compile command runs locally if it can not be distributed or worker fails
+    '''
+    try:
+        from shlex import quote
+    except ImportError: # python 2
+        from pipes import quote
+    import subprocess, hashlib
+    with open(args[0], 'r') as f:
+        config = json.load(f)
+    command = args[1:]
+    split = split_compile_command(command)
+    if not split:
+        return subprocess.call(command)
+    source, output, preprocess_command, remote_args = split
+    start = time.time()
+    preprocessed = output + '.distributed.i'
+    return_code = subprocess.call(preprocess_command)
+    if 0 != return_code:
+        return return_code
+    def record(result, worker = None):
+        with open(config['stats_file'], 'a') as f:
+            f.write(json.dumps({'source': source, 'result': result, 'worker': worker, 'seconds': time.time() - start}) + '\n')
+    try:
+        source_hash = hashlib.sha1()
+        with open(preprocessed, 'rb') as f:
+            for chunk in iter(lambda : f.read(1024 * 1024), b''):
+                source_hash.update(chunk)
+        def object_key(worker):
+            return distributed_object_key(config, worker, command[0], remote_args, source_hash.hexdigest())
+        cache = create_artifact_cache(config['cache'], config['cache_size'], suffix = '.o')
+        # object compiled by any worker of the pool will do, each one is cached under toolchain of the worker which compiled it
+        keys = []
+        for worker in config['workers']:
+            if object_key(worker) not in keys:
+                keys.append(object_key(worker))
+        if any(cache.fetch(key, output) for key in keys):
+            record('cache hit')
+            return 0
+        worker, lock_file = acquire_distributed_slot(config)
+        try:
+            language = DISTRIBUTED_SOURCE_EXTENSIONS[os.path.splitext(source)[1]]
+            script = 'out=$(mktemp) && {0} -x {1} -c - -o "$out" && cat "$out"; status=$?; rm -f "$out"; exit $status'.format( \
+                ' '.join(quote(a) for a in remote_args), language)
+            with open(preprocessed, 'rb') as f:
+                process = subprocess.Popen(DISTRIBUTED_TRANSPORTS[worker['transport']](worker['host']).command(script), \
+                    stdin = f, stdout = subprocess.PIPE, stderr = subprocess.PIPE)
+                stdout, stderr = process.communicate()
+        finally:
+            lock_file.close()
+        worker_name = '{0}:{1}'.format(worker['transport'], worker['host'])
+        if 0 != process.returncode or not stdout:
+            # compile errors && worker failures alike, local compile gives diagnostics with original file names
+            sys.stderr.write('compiling {0} on {1} failed with exit code {2}, compiling locally\n'.format(source, worker_name, process.returncode))
+            return_code = subprocess.call(command)
+            record('local fallback')
+            return return_code
+        getattr(sys.stderr, 'buffer', sys.stderr).write(stderr) # warnings
+        temp_output = '{0}.{1}.tmp'.format(output, os.getpid())
+        with open(temp_output, 'wb') as f:
+            f.write(stdout)
+        os.rename(temp_output, output)
+        cache.store(object_key(worker), output)
+        record('remote', worker_name)
+        return 0
+    finally:
+        if os.path.exists(preprocessed):
+            os.remove(preprocessed)
+
+
+def distributed_object_key(config, worker, compiler, remote_args, source_digest):
+    '''
+    key of object compiled by worker in distributed object cache, from compile arguments, preprocessed source
+    && toolchain of worker, docker workers run toolchain image, local && ssh workers are assumed to run local compiler
+    '''
+    import hashlib
+    if 'docker' == worker['transport']:
+        toolchain = ['docker', config['docker_toolchain']]
+    elif os.path.isfile(compiler):
+        compiler_stat = os.stat(compiler)
+        toolchain = [os.path.realpath(compiler), compiler_stat.st_size, compiler_stat.st_mtime]
+    else:
+        toolchain = compiler
+    return hashlib.sha1(json.dumps([remote_args, toolchain, source_digest]).encode('utf-8')).hexdigest()
+
+
+def strip_arguments(args, options, flags = ()):
+    '''
+    remove options (with their values) && flags from command line arguments args,
+    values given as --option=value or -ovalue are removed too
+    '''
+    stripped = []
+    skip_value = False
+    for arg in args:
+        if skip_value:
+            skip_value = False
+        elif arg in options:
+            skip_value = True
+        elif arg in flags or arg.split('=', 1)[0] in options:
+            continue
+        elif not arg.startswith('--') and arg[:2] in options:
+            continue
+        else:
+            stripped.append(arg)
+    return stripped
+
+
+def compile_gitignore_pattern(pattern):
+    '''
+    regex of a .gitignore glob pattern as git matches it, * ? && [] never match /,
+    leading **/, trailing /** && /**/ match across directories
+    '''
+    regex = ''
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith('**', i) and (0 == i or '/' == pattern[i - 1]) and (i + 2 == n or '/' == pattern[i + 2]):
+            if i + 2 == n:
+                regex += '.*' # trailing /** matches everything inside
+                i += 2
+            else:
+                regex += '(?:.*/)?' # leading **/ or /**/ matches zero or more directories
+                i += 3
+        elif '*' == c:
+            regex += '[^/]*'
+            i += 1
+        elif '?' == c:
+            regex += '[^/]'
+            i += 1
+        elif '[' == c and pattern.find(']', i + 2) > 0: # ] right after [ is a member of the class
+            j = pattern.find(']', i + 2)
+            members = pattern[i + 1:j]
+            regex += '(?!/)[' + ('^' + members[1:] if members.startswith('!') else members) + ']'
+            i = j + 1
+        elif '\\' == c and i + 1 < n:
+            regex += re.escape(pattern[i + 1])
+            i += 2
+        else:
+            regex += re.escape(c)
+            i += 1
+    return re.compile(regex + '$')
+
+
+def decode_output(data):
+    '''
+    text of process output, bytes not valid in locale encoding are replaced instead of raising
+    '''
+    if isinstance(data, str): # python 2
+        return data
+    import locale
+    return data.decode(locale.getpreferredencoding(False), 'replace')
+
+
+def get_daemon_socket():
+    return os.path.join(get_cache_dir(), 'daemon.sock')
+
+
+def run_daemon_client(args):
+    '''
+    hand build over to build daemon && stream its output, return exit code, None if no daemon is running
+    '''
+    import socket, struct
+    daemon_socket = get_daemon_socket()
+    for i, arg in enumerate(args):
+        if '--daemon-socket' == arg and i + 1 < len(args):
+            daemon_socket = args[i + 1]
+        elif arg.startswith('--daemon-socket='):
+            daemon_socket = arg.split('=', 1)[1]
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(daemon_socket)
+    except (IOError, OSError):
+        return None
+    if '--daemon-stop' in args:
+        request = {'command': 'stop'}
+    else:
+        request = {'args': strip_arguments(args, ['--daemon-socket'], ['--use-daemon']), 'cwd': os.getcwd(), 'env': dict(os.environ)}
+    client.sendall((json.dumps(request) + '\n').encode('utf-8'))
+    stream = client.makefile('rb')
+    output = getattr(sys.stdout, 'buffer', sys.stdout)
+    return_code = 0 if 'stop' == request.get('command') else 1
+    while True:
+        header = stream.read(5)
+        if len(header) < 5:
+            break
+        frame, value = header[:1], struct.unpack('>I', header[1:])[0]
+        if DAEMON_FRAME_EXIT == frame:
+            return_code = value
+            break
+        output.write(stream.read(value))
+        output.flush()
+    client.close()
+    return return_code
+
+
+def get_cache_dir():
+    '''
+    per user cache directory of this builder
+    '''
+    if 'Windows' == host_system() and os.environ.get('LOCALAPPDATA'):
+        return os.path.join(os.environ['LOCALAPPDATA'], 'cmake_cpp_builder')
+    return os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')), 'cmake_cpp_builder')
+
+
+def run_profile_launcher(args):
+    '''
+    timing launcher of --profile-build, args are : profile log, kind (compile or link), command to run
+    '''
+    import subprocess
+    profile_log, kind, command = args[0], args[1], args[2:]
+    start = time.time()
+    return_code = subprocess.call(command)
+    end = time.time()
+    output = command[command.index('-o') + 1] if '-o' in command[:-1] else None
+    inputs = [a for a in command[1:] if 'link' == kind and a.endswith(OBJECT_FILE_EXTENSIONS + LINK_OUTPUT_EXTENSIONS) and not a.startswith('-')]
+    record = {'kind': kind, 'start': start, 'end': end, \
+        'output': os.path.abspath(output) if output else None, 'inputs': [os.path.abspath(i) for i in inputs]}
+    with open(profile_log, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+    return return_code
+
+
 def main():
+    if len(sys.argv) > 1 and PROFILE_LAUNCHER_ARG == sys.argv[1]:
+        sys.exit(run_profile_launcher(sys.argv[2:]))
+    if len(sys.argv) > 1 and SCHEDULE_LAUNCHER_ARG == sys.argv[1]:
+        sys.exit(run_schedule_launcher(sys.argv[2:]))
+    if len(sys.argv) > 1 and DISTRIBUTED_LAUNCHER_ARG == sys.argv[1]:
+        sys.exit(run_distributed_launcher(sys.argv[2:]))
+    if '-v' in sys.argv[1:] or '--version' in sys.argv[1:]:
+        print(VERSION)
+        sys.exit(0)
+    if '--use-daemon' in sys.argv[1:] or '--daemon-stop' in sys.argv[1:]:
+        return_code = run_daemon_client(sys.argv[1:])
+        if return_code is not None:
+            sys.exit(return_code)
+        if '--daemon-stop' in sys.argv[1:]:
+            sys.exit(0) # no daemon running
+        print('no build daemon running, build locally', file=sys.stderr)
     CMakeCPPBuilder().start(args = sys.argv[1:])
     
     
@@ -0,0 +1,197 @@
+#!/usr/bin/python
+#-*-encoding:utf-8-*-
+'''
+unit tests of pure helpers of build.py
+
+    python -m unittest discover -s tests
+'''
+import os, sys, shutil, tempfile, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import build
+
+
+class GitIgnoreTest(unittest.TestCase):
+    def setUp(self):
+        self.builder = build.CMakeCPPBuilder()
+
+    def ignored(self, gitignore, rel_path, is_dir = False, rel_dir = ''):
+        rules = self.builder.parse_gitignore(gitignore, rel_dir)
+        return self.builder.is_git_ignored(rel_path, is_dir, rules)
+
+    def test_unanchored_pattern_matches_name_in_any_directory(self):
+        self.assertTrue(self.ignored('*.o', 'a.o'))
+        self.assertTrue(self.ignored('*.o', 'src/deep/a.o'))
+        self.assertFalse(self.ignored('*.o', 'a.cpp'))
+
+    def test_star_does_not_match_slash(self):
+        self.assertTrue(self.ignored('doc/*.txt', 'doc/notes.txt'))
+        self.assertFalse(self.ignored('doc/*.txt', 'doc/a/notes.txt'))
+        self.assertFalse(self.ignored('doc/?.txt', 'doc/a/b.txt'))
+        self.assertFalse(self.ignored('doc[/]a.txt', 'doc/a.txt'))
+
+    def test_anchored_pattern_matches_from_gitignore_directory(self):
+        self.assertTrue(self.ignored('/build', 'build', is_dir = True))
+        self.assertFalse(self.ignored('/build', 'src/build', is_dir = True))
+        self.assertTrue(self.ignored('out/*.log', 'sub/out/a.log', rel_dir = 'sub/'))
+        self.assertFalse(self.ignored('out/*.log', 'out/a.log', rel_dir = 'sub/'))
+
+    def test_double_star(self):
+        self.assertTrue(self.ignored('**/gen', 'gen', is_dir = True))
+        self.assertTrue(self.ignored('**/gen', 'a/b/gen', is_dir = True))
+        self.assertTrue(self.ignored('doc/**', 'doc/a/notes.txt'))
+        self.assertFalse(self.ignored('doc/**', 'doc'))
+        self.assertTrue(self.ignored('a/**/b', 'a/b'))
+        self.assertTrue(self.ignored('a/**/b', 'a/x/y/b'))
+        self.assertFalse(self.ignored('a/**/b', 'a/x/c'))
+
+    def test_character_class(self):
+        self.assertTrue(self.ignored('*.[oa]', 'lib.a'))
+        self.assertFalse(self.ignored('*.[!oa]', 'lib.a'))
+        self.assertTrue(self.ignored('*.[!oa]', 'lib.c'))
+
+    def test_dir_only_negation_and_comments(self):
+        gitignore = '# comment\n\nlogs/\n*.log\n!keep.log\n'
+        self.assertTrue(self.ignored(gitignore, 'logs', is_dir = True))
+        self.assertFalse(self.ignored(gitignore, 'logs', is_dir = False))
+        self.assertTrue(self.ignored(gitignore, 'a.log'))
+        self.assertFalse(self.ignored(gitignore, 'keep.log'))
+
+    def test_escaped_characters(self):
+        self.assertTrue(self.ignored('\\#hash', '#hash'))
+        self.assertTrue(self.ignored('a.b', 'a.b'))
+        self.assertFalse(self.ignored('a.b', 'axb'))
+
+
+class DiagnosticsParserTest(unittest.TestCase):
+    def test_classifies_compiler_linker_and_tool_lines(self):
+        parser = build.DiagnosticsParser()
+        self.assertEqual(('error', 'compile'), parser.parse("main.cpp:3:5: error: 'x' was not declared\n")[:2])
+        self.assertEqual(('warning', 'compile'), parser.parse('main.cpp:4:1: warning: unused variable')[:2])
+        self.assertEqual(('error', 'compile'), parser.parse('main.cpp(3): error C2065: undeclared identifier')[:2])
+        self.assertEqual(('error', 'link'), parser.parse("main.cpp:(.text+0x5): undefined reference to `fa()'")[:2])
+        self.assertEqual(('error', 'link'), parser.parse('main.obj : error LNK2019: unresolved external symbol')[:2])
+        self.assertEqual(('error', 'cmake'), parser.parse('CMake Error at CMakeLists.txt:3 (add_executable):')[:2])
+        self.assertEqual(('error', 'build tool'), parser.parse('make[2]: *** [CMakeFiles/a.dir/build.make:76: a.o] Error 1')[:2])
+        self.assertIsNone(parser.parse('main.cpp:3:5: note: declared here'))
+        self.assertIsNone(parser.parse('[ 50%] Building CXX object CMakeFiles/a.dir/main.cpp.o'))
+        self.assertEqual(6, parser.n_errors)
+        self.assertEqual(1, parser.n_warnings)
+
+    def test_repeated_diagnostic_counted_once(self):
+        parser = build.DiagnosticsParser()
+        line = 'main.cpp(3): error C2065: undeclared identifier'
+        parser.parse(line)
+        self.assertIsNotNone(parser.parse(line))
+        self.assertEqual(1, parser.n_errors)
+        self.assertEqual([('error', 'compile', line)], parser.errors)
+
+    def test_make_job_control_messages_are_not_errors(self):
+        parser = build.DiagnosticsParser()
+        self.assertIsNone(parser.parse('make[2]: *** Waiting for unfinished jobs....'))
+        self.assertIsNone(parser.parse('make[1]: *** wait: No child processes.  Stop.'))
+        self.assertIsNone(parser.parse("make: *** Deleting file 'a.o'"))
+        self.assertIsNotNone(parser.parse("make: *** No rule to make target 'b.o', needed by 'a'.  Stop."))
+        self.assertEqual(1, parser.n_errors)
+
+
+class CompilerCacheStatsTest(unittest.TestCase):
+    def stats(self, launcher, stdout, stdout_before = None):
+        builder = build.CMakeCPPBuilder()
+        builder.compiler_cache_launcher = launcher
+        builder.compiler_cache_dir = '/cache'
+        outputs = [stdout_before, stdout] if stdout_before else [stdout]
+        builder.run_shell_command = lambda command, log_info = True: (outputs.pop(0), '')
+        messages = []
+        builder.logger.info = messages.append
+        if stdout_before:
+            builder.record_compiler_cache_stats()
+        builder.report_compiler_cache_stats()
+        return messages[-1]
+
+    def test_ccache4_counts_cacheable_calls_once(self):
+        stdout = 'Cacheable calls:    6 / 6 (100.0%)\n  Hits:             4 / 6 (66.67%)\n    Direct:         4 / 4 (100.0%)\n' \
+            '  Misses:           2 / 6 (33.33%)\nLocal storage:\n  Cache size (GB): 0.0 / 5.0 ( 0.00%)\n' \
+            '  Hits:             4 / 6 (66.67%)\n  Misses:           2 / 6 (33.33%)\n'
+        self.assertIn('4 hits, 2 misses', self.stats('ccache', stdout))
+
+    def test_reports_difference_to_stats_before_build(self):
+        before = 'cache hit (direct)                     5\ncache miss                             1\n'
+        after = 'cache hit (direct)                     8\ncache hit (preprocessed)               1\ncache miss                             3\n'
+        self.assertIn('4 hits, 2 misses', self.stats('ccache', after, before))
+        self.assertIn('4 hits, 0 misses', self.stats('sccache', 'Cache hits 4\nCache misses 0\n', 'Cache hits 9\nCache misses 3\n'))
+
+    def test_ccache3_sums_direct_and_preprocessed_hits(self):
+        stdout = 'cache hit (direct)                     3\ncache hit (preprocessed)               1\ncache miss                             2\n'
+        self.assertIn('4 hits, 2 misses', self.stats('ccache', stdout))
+
+
+class StripArgumentsTest(unittest.TestCase):
+    def test_strips_options_with_values_and_flags(self):
+        args = ['-vv', '-d', '-T', 'Debug', '--jobs=4', '-j4', '-w', 'out', '--build-tool', 'ninja', 'install']
+        stripped = build.strip_arguments(args, ['-T', '--build-type', '-j', '--jobs', '-w', '-t', '--build-tool'], ['-d', '--Debug'])
+        self.assertEqual(['-vv', 'install'], stripped)
+
+    def test_keeps_unrelated_arguments(self):
+        args = ['--matrix-build-types', 'Debug,Release', '--test', '--test-pattern', 'packages/*']
+        self.assertEqual(['--test', '--test-pattern', 'packages/*'], build.strip_arguments(args, ['--matrix-build-types']))
+
+
+class ParseDistributedWorkersTest(unittest.TestCase):
+    def test_transports_hosts_and_slots(self):
+        workers = build.parse_distributed_workers('ssh:user@build1*8, local*2,docker*4,build2')
+        self.assertEqual([
+            {'transport': 'ssh', 'host': 'user@build1', 'slots': 8},
+            {'transport': 'local', 'host': 'localhost', 'slots': 2},
+            {'transport': 'docker', 'host': None, 'slots': 4},
+            {'transport': 'ssh', 'host': 'build2', 'slots': 1},
+        ], workers)
+
+    def test_invalid_workers(self):
+        self.assertRaises(Exception, build.parse_distributed_workers, 'ftp:host')
+        self.assertRaises(Exception, build.parse_distributed_workers, 'local*many')
+
+
+class SplitCompileCommandTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.source = os.path.join(self.work_dir, 'a.cpp')
+        with open(self.source, 'w') as f:
+            f.write('int a() { return 1; }\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_splits_plain_compile(self):
+        command = ['c++', '-DNDEBUG', '-Iinclude', '-O2', '-MD', '-MT', 'a.o', '-MF', 'a.o.d', '-o', 'a.o', '-c', self.source]
+        source, output, preprocess_command, remote_args = build.split_compile_command(command)
+        self.assertEqual(self.source, source)
+        self.assertEqual('a.o', output)
+        self.assertEqual(['c++', '-DNDEBUG', '-Iinclude', '-O2', '-MD', '-MT', 'a.o', '-MF', 'a.o.d', '-E', self.source, \
+            '-o', 'a.o.distributed.i'], preprocess_command)
+        self.assertEqual(['c++', '-DNDEBUG', '-Iinclude', '-O2'], remote_args)
+
+    def test_dependency_target_defaults_to_object(self):
+        _, _, preprocess_command, _ = build.split_compile_command(['cc', '-MMD', '-o', 'a.o', '-c', self.source])
+        self.assertEqual(['-MT', 'a.o'], preprocess_command[-2:])
+
+    def test_rejects_commands_it_can_not_distribute(self):
+        self.assertIsNone(build.split_compile_command(['c++', '-o', 'a', self.source])) # compile && link
+        self.assertIsNone(build.split_compile_command(['c++', '-E', '-o', 'a.i', '-c', self.source]))
+        self.assertIsNone(build.split_compile_command(['c++', '-o', 'a.o', '-c', os.path.join(self.work_dir, 'missing.cpp')]))
+        self.assertIsNone(build.split_compile_command(['ld', '-o', 'a.out', 'a.o']))
+
+
+class DistributedObjectKeyTest(unittest.TestCase):
+    def test_object_keyed_by_toolchain_of_worker(self):
+        config = {'docker_toolchain': 'gcc:12'}
+        local, ssh, docker = {'transport': 'local'}, {'transport': 'ssh'}, {'transport': 'docker'}
+        key = lambda worker, toolchain = config : build.distributed_object_key(toolchain, worker, sys.executable, ['c++', '-O2'], 'abc')
+        self.assertEqual(key(local), key(ssh))
+        self.assertNotEqual(key(local), key(docker))
+        self.assertNotEqual(key(docker), key(docker, {'docker_toolchain': 'gcc:13'}))
+        self.assertEqual(key(local), key(local, {'docker_toolchain': 'gcc:13'}))
+
+
+if '__main__' == __name__:
+    unittest.main()